@@ -0,0 +1,206 @@
+"""Навантажувальний тест бота на локальних заглушках OpenWeather і Telegram Bot API.
+
+Піднімає справжній aiohttp-застосунок з main.py (webhook, черги, планувальник,
+SQLite у тимчасовій теці), спрямований на заглушки з benchmarks/stubs.py, і
+проганяє два сценарії:
+  webhook — відтворення синтетичних оновлень (/start і «Погода зараз») через
+            POST /webhook: пропускна здатність, p50/p99 відповіді webhook і
+            час до обробки всіх оновлень воркерами;
+  slot    — розсилка одного слоту сповіщень на N користувачів: пропускна
+            здатність і p50/p99 від початку слоту до отримання повідомлення
+            (погода міст уже в кеші після першого сценарію, тож слот
+            переважно міряє журнал доставок і чергу надсилання).
+Наприкінці виводить підсумкові гістограми з /metrics.
+
+Запуск з кореня репозиторію:
+    python benchmarks/load_test.py [--updates 5000] [--users 2000] [--cities 50]
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import statistics
+import sys
+import tempfile
+import time
+from datetime import date
+
+import aiohttp
+from aiohttp import web
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+from benchmarks.stubs import FakeOpenWeather, FakeTelegram  # noqa: E402
+
+USER_ID_BASE = 100000
+
+
+def percentile(values, q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * q))]
+
+
+def report(name: str, count: int, elapsed: float, latencies_ms, unit: str = "оновлень"):
+    print(
+        f"{name:8} {unit}={count:6d} за {elapsed:6.2f}s  {count / elapsed:8.0f}/s  "
+        f"p50={statistics.median(latencies_ms):7.1f}ms p99={percentile(latencies_ms, 0.99):7.1f}ms"
+    )
+
+
+def make_update(update_id: int, user_id: int) -> bytes:
+    """Парні оновлення — команда /start, непарні — натискання «Погода зараз»."""
+    user = {"id": user_id, "is_bot": False, "first_name": "Тест", "language_code": "uk"}
+    chat = {"id": user_id, "type": "private", "first_name": "Тест"}
+    if update_id % 2 == 0:
+        payload = {"message": {
+            "message_id": update_id, "date": 1760000000, "chat": chat, "from": user,
+            "text": "/start", "entities": [{"type": "bot_command", "offset": 0, "length": 6}],
+        }}
+    else:
+        payload = {"callback_query": {
+            "id": str(update_id), "from": user, "chat_instance": "-1", "data": "weather_current",
+            "message": {
+                "message_id": 42, "date": 1760000000, "chat": chat,
+                "from": {"id": 1, "is_bot": True, "first_name": "WeatherBot"},
+                "text": "Оберіть, яку погоду показати:",
+            },
+        }}
+    payload["update_id"] = update_id
+    return json.dumps(payload, ensure_ascii=False).encode()
+
+
+def seed_users(database, users: int, cities: int, notify_time: str):
+    for i in range(users):
+        user_id = USER_ID_BASE + i
+        picked = {(i + j * 7) % cities for j in range(3)}
+        database.set_cities(user_id, [(f"city{k}", f"Місто{k}") for k in sorted(picked)])
+        database.set_notify_times(user_id, [notify_time])
+
+
+async def replay_webhook(base_url: str, count: int, users: int, concurrency: int, update_queue):
+    payloads = [make_update(i + 1, USER_ID_BASE + i % users) for i in range(count)]
+    baseline = update_queue.stats()
+    handled_before = baseline["processed"] + baseline["failed"]
+    latencies, statuses = [], {}
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async with aiohttp.ClientSession() as session:
+        async def post(body: bytes):
+            async with semaphore:
+                started = time.perf_counter()
+                async with session.post(f"{base_url}/webhook", data=body,
+                                        headers={"Content-Type": "application/json"}) as response:
+                    await response.read()
+                latencies.append((time.perf_counter() - started) * 1000)
+                statuses[response.status] = statuses.get(response.status, 0) + 1
+
+        started = time.perf_counter()
+        await asyncio.gather(*(post(body) for body in payloads))
+        accepted = time.perf_counter() - started
+        accepted_count = statuses.get(200, 0)
+        while True:
+            stats = update_queue.stats()
+            if stats["processed"] + stats["failed"] - handled_before >= accepted_count:
+                break
+            await asyncio.sleep(0.01)
+        handled = time.perf_counter() - started
+
+    report("webhook", count, accepted, latencies)
+    print(f"  статуси відповідей: {statuses}; оброблено воркерами за {handled:.2f}s ({accepted_count / handled:.0f}/s)")
+
+
+async def run_slot(users: int, notify_time: str, telegram: FakeTelegram, openweather: FakeOpenWeather):
+    from database import create_deliveries_async
+    from scheduler import deliver_slot
+    from sender import delivery_queue
+
+    hours, minutes = map(int, notify_time.split(":"))
+    slot = hours * 60 + minutes
+    day = date.today().isoformat()
+    user_ids = [USER_ID_BASE + i for i in range(users)]
+    telegram.reset()
+    upstream_before = openweather.calls
+
+    started = time.perf_counter()
+    await create_deliveries_async(day, slot, user_ids)
+    tally = await deliver_slot(day, slot)
+    await delivery_queue.join()
+    elapsed = time.perf_counter() - started
+
+    latencies = [(telegram.delivered_at[uid] - started) * 1000 for uid in user_ids if uid in telegram.delivered_at]
+    report("slot", len(latencies), elapsed, latencies, unit="повідомл.")
+    print(
+        f"  запитів до OpenWeather: {openweather.calls - upstream_before}, "
+        f"заощаджено групуванням: {tally['upstream_calls_saved']}"
+    )
+
+
+async def print_metrics(base_url: str):
+    async with aiohttp.ClientSession() as session:
+        async with session.get(f"{base_url}/metrics") as response:
+            text = await response.text()
+    print("\n/metrics (кількість і сума гістограм):")
+    for line in text.splitlines():
+        if line.startswith("weatherbot_") and ("_count" in line or "_sum" in line or "_total" in line):
+            print("  " + line)
+
+
+async def main_async(args):
+    openweather = await FakeOpenWeather(latency=args.ow_latency).start()
+    telegram = await FakeTelegram(latency=args.tg_latency).start()
+    os.environ.update({
+        "BOT_TOKEN": "123456:TEST",
+        "WEBHOOK_URL": "http://127.0.0.1/webhook",
+        "TELEGRAM_API_URL": telegram.url,
+        "OPENWEATHER_BASE_URL": openweather.base_url,
+        "OPENWEATHER_GEO_URL": openweather.geo_url,
+    })
+    # Заглушка Telegram не обмежує частоту, тож знімаємо глобальний ліміт надсилання
+    os.environ.setdefault("TELEGRAM_GLOBAL_RATE", "100000")
+    os.environ.setdefault("UPDATE_QUEUE_SIZE", str(max(args.updates, 1000)))
+    os.environ.setdefault("SEND_QUEUE_SIZE", str(max(args.users, 1000)))
+
+    import database
+    import main
+
+    # Слот на 12 годин від поточного часу, щоб справжній щохвилинний тік його не зачепив
+    now = time.localtime()
+    notify_time = "%02d:%02d" % ((now.tm_hour + 12) % 24, now.tm_min)
+    seed_users(database, args.users, args.cities, notify_time)
+
+    runner = web.AppRunner(main.create_app(), access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    base_url = "http://127.0.0.1:%d" % site._server.sockets[0].getsockname()[1]
+    try:
+        await replay_webhook(base_url, args.updates, args.users, args.concurrency, main.update_queue)
+        await run_slot(args.users, notify_time, telegram, openweather)
+        await print_metrics(base_url)
+    finally:
+        await runner.cleanup()
+        await telegram.stop()
+        await openweather.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--updates", type=int, default=5000, help="кількість синтетичних оновлень webhook")
+    parser.add_argument("--concurrency", type=int, default=50, help="одночасних POST /webhook")
+    parser.add_argument("--users", type=int, default=2000, help="користувачів у слоті сповіщень")
+    parser.add_argument("--cities", type=int, default=50, help="різних міст серед користувачів")
+    parser.add_argument("--ow-latency", type=float, default=0.05, help="затримка заглушки OpenWeather, с")
+    parser.add_argument("--tg-latency", type=float, default=0.01, help="затримка заглушки Telegram, с")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    with tempfile.TemporaryDirectory() as tmp:
+        # weather_bot.db створюється в поточній теці, тож працюємо в тимчасовій
+        os.chdir(tmp)
+        asyncio.run(main_async(args))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,205 @@
+"""Локальні заглушки зовнішніх сервісів для бенчмарків і ручних перевірок.
+
+FakeOpenWeather імітує /data/2.5/{weather,forecast} та /geo/1.0/direct
+з налаштовуваною затримкою і часткою збоїв (5xx або обрив з'єднання), тож
+повтори, бюджет часу і запобіжник WeatherClient можна перевірити без мережі.
+FakeTelegram імітує методи Bot API, які викликає бот, і запам'ятовує,
+коли кожен чат отримав повідомлення.
+
+Бот спрямовується на заглушки змінними оточення:
+    OPENWEATHER_BASE_URL=http://127.0.0.1:<port>/data/2.5/
+    OPENWEATHER_GEO_URL=http://127.0.0.1:<port>/geo/1.0/
+    TELEGRAM_API_URL=http://127.0.0.1:<port>
+"""
+import abc
+import asyncio
+import random
+import time
+import zlib
+
+from aiohttp import web
+
+NOT_FOUND = "nowhere"
+
+
+def current_payload(city: str) -> dict:
+    return {
+        "weather": [{"id": 500, "description": "легкий дощ"}],
+        "main": {"temp": 21.5, "feels_like": 21.0, "humidity": 70},
+        "wind": {"speed": 3.2},
+        "name": city,
+        "timezone": 7200,
+        "coord": {"lat": 50.45, "lon": 30.52},
+    }
+
+
+def forecast_payload(city: str, start: int = 1760000400) -> dict:
+    entries = []
+    for i in range(40):
+        dt = start + i * 10800
+        entries.append({
+            "dt": dt,
+            "dt_txt": time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime(dt)),
+            "main": {"temp": 10 + i % 8, "temp_min": 9 + i % 8, "temp_max": 11 + i % 8, "humidity": 60 + i % 20},
+            "wind": {"speed": 2 + i % 5},
+            "weather": [{"id": (800, 500, 802)[i % 3], "description": ("чисте небо", "легкий дощ", "хмарно")[i % 3]}],
+        })
+    return {"city": {"name": city, "timezone": 10800, "coord": {"lat": 50.45, "lon": 30.52}}, "list": entries}
+
+
+class StubServer(abc.ABC):
+    """Базовий aiohttp-сервер заглушки на 127.0.0.1; маршрути задають підкласи в routes()."""
+
+    def __init__(self, port: int = 0):
+        self.port = port
+        self.calls = 0
+        self._runner = None
+
+    @abc.abstractmethod
+    def routes(self, app: web.Application):
+        """Реєструє обробники заглушки в app."""
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.port}"
+
+    async def start(self):
+        app = web.Application()
+        self.routes(app)
+        # Не чекаємо на обробники, що «зависли» навмисно (fail_mode="hang")
+        self._runner = web.AppRunner(app, access_log=None, shutdown_timeout=0.1)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, "127.0.0.1", self.port)
+        await site.start()
+        if not self.port:
+            self.port = site._server.sockets[0].getsockname()[1]
+        return self
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+
+class FakeOpenWeather(StubServer):
+    """Заглушка OpenWeather із затримкою latency (с) і часткою збоїв fail_rate.
+
+    fail_mode: "status" — відповідь fail_status (503 за замовчуванням),
+    "hang" — відповідь не приходить довше за таймаут клієнта,
+    "reset" — з'єднання обривається без відповіді.
+    """
+
+    def __init__(self, port: int = 0, latency: float = 0.01, fail_rate: float = 0.0,
+                 fail_mode: str = "status", fail_status: int = 503):
+        super().__init__(port)
+        self.latency = latency
+        self.fail_rate = fail_rate
+        self.fail_mode = fail_mode
+        self.fail_status = fail_status
+        self.failures = 0
+
+    @property
+    def base_url(self) -> str:
+        return f"{self.url}/data/2.5/"
+
+    @property
+    def geo_url(self) -> str:
+        return f"{self.url}/geo/1.0/"
+
+    def routes(self, app: web.Application):
+        app.router.add_get("/data/2.5/{kind}", self.weather)
+        app.router.add_get("/geo/1.0/direct", self.geocode)
+
+    async def _maybe_fail(self, request: web.Request):
+        if self.fail_rate <= 0 or random.random() >= self.fail_rate:
+            return None
+        self.failures += 1
+        if self.fail_mode == "hang":
+            await asyncio.sleep(3600)
+        if self.fail_mode == "reset":
+            request.transport.close()
+            raise web.HTTPServiceUnavailable()
+        return web.json_response({"cod": str(self.fail_status), "message": "stub failure"}, status=self.fail_status)
+
+    async def weather(self, request: web.Request) -> web.Response:
+        self.calls += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        failure = await self._maybe_fail(request)
+        if failure is not None:
+            return failure
+        city = request.query.get("q") or request.query.get("lat", "")
+        if city.strip().lower() == NOT_FOUND:
+            return web.json_response({"cod": "404", "message": "city not found"}, status=404)
+        if request.match_info["kind"] == "weather":
+            return web.json_response(current_payload(city))
+        return web.json_response(forecast_payload(city))
+
+    async def geocode(self, request: web.Request) -> web.Response:
+        self.calls += 1
+        failure = await self._maybe_fail(request)
+        if failure is not None:
+            return failure
+        name = request.query.get("q", "").strip()
+        if name.lower() == NOT_FOUND:
+            return web.json_response([])
+        # Детерміновані координати для кожної назви, щоб різні міста не зливалися в одне
+        digest = zlib.crc32(name.lower().encode())
+        return web.json_response([{
+            "name": name.title(), "local_names": {"uk": name.title()},
+            "lat": 44 + digest % 800 / 100, "lon": 22 + digest // 800 % 1800 / 100, "country": "UA",
+        }])
+
+
+class FakeTelegram(StubServer):
+    """Заглушка Telegram Bot API: відповідає успіхом на будь-який метод із затримкою latency.
+
+    Чати з blocked_chats отримують 403, як від користувача, що заблокував бота.
+    """
+
+    def __init__(self, port: int = 0, latency: float = 0.0):
+        super().__init__(port)
+        self.latency = latency
+        self.blocked_chats = set()
+        self.methods = {}
+        # chat_id -> time.perf_counter() першого отриманого повідомлення
+        self.delivered_at = {}
+        self._message_ids = 0
+
+    def routes(self, app: web.Application):
+        app.router.add_route("*", "/bot{token}/{method}", self.call)
+
+    def reset(self):
+        self.calls = 0
+        self.methods.clear()
+        self.delivered_at.clear()
+
+    async def call(self, request: web.Request) -> web.Response:
+        received = time.perf_counter()
+        self.calls += 1
+        method = request.match_info["method"]
+        self.methods[method] = self.methods.get(method, 0) + 1
+        params = dict(await request.post()) if request.can_read_body else {}
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        lowered = method.lower()
+        if lowered == "getwebhookinfo":
+            result = {"url": "", "has_custom_certificate": False, "pending_update_count": 0}
+        elif lowered in ("sendmessage", "editmessagetext"):
+            chat_id = int(params.get("chat_id", 0))
+            if chat_id in self.blocked_chats:
+                return web.json_response(
+                    {"ok": False, "error_code": 403, "description": "Forbidden: bot was blocked by the user"}, status=403,
+                )
+            if lowered == "sendmessage":
+                self.delivered_at.setdefault(chat_id, received)
+            self._message_ids += 1
+            result = {
+                "message_id": self._message_ids,
+                "date": int(time.time()),
+                "chat": {"id": chat_id, "type": "private"},
+                "text": params.get("text", ""),
+            }
+        else:
+            result = True
+        return web.json_response({"ok": True, "result": result})
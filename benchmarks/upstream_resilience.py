@@ -0,0 +1,175 @@
+"""Перевірка стійкості клієнта OpenWeather на локальній заглушці.
+
+Сценарії з перевірками (кожна друкує OK або FAIL, код виходу 1 при збої):
+  deadline — OpenWeather зависає: запит завершується в межах бюджету часу;
+  open     — після CIRCUIT_FAILURE_THRESHOLD збоїв поспіль запобіжник розмикається,
+             і запити відхиляються без звернень до OpenWeather;
+  probe    — після reset_timeout з кількох одночасних запитів до OpenWeather
+             доходить рівно один пробний, і його успіх замикає запобіжник;
+  stale    — поки запобіжник розімкнено, міста з кешу віддаються зі старими даними.
+Наприкінці — довідкові виміри: частина відповідей 503 (flaky) і зависань (hang).
+
+Запуск з кореня репозиторію:
+    python benchmarks/upstream_resilience.py [--requests 200]
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from benchmarks.stubs import FakeOpenWeather  # noqa: E402
+
+# Короткі таймаути, щоб сценарії тривали секунди, а не хвилини
+os.environ.setdefault("OPENWEATHER_TIMEOUT", "0.3")
+os.environ.setdefault("OPENWEATHER_DEADLINE", "1")
+os.environ.setdefault("CIRCUIT_RESET_TIMEOUT", "1")
+
+# Допуск на планування циклу подій понад бюджет часу запиту, с
+DEADLINE_SLACK = 0.25
+
+failures = []
+
+
+def check(name: str, condition: bool, details: str = ""):
+    print(f"{'OK  ' if condition else 'FAIL'} {name}" + (f" ({details})" if details else ""))
+    if not condition:
+        failures.append(name)
+
+
+def percentile(values, q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * q))]
+
+
+async def measure(name: str, count: int, call):
+    latencies, errors = [], 0
+    for i in range(count):
+        started = time.perf_counter()
+        try:
+            await call(i)
+        except Exception:
+            errors += 1
+        latencies.append((time.perf_counter() - started) * 1000)
+    print(
+        f"{name:8} запитів={count:4d} помилок={errors:4d} "
+        f"p50={statistics.median(latencies):7.1f}ms p99={percentile(latencies, 0.99):7.1f}ms"
+    )
+
+
+async def main_async(count: int):
+    stub = await FakeOpenWeather(latency=0.005).start()
+    os.environ["OPENWEATHER_BASE_URL"] = stub.base_url
+    os.environ["OPENWEATHER_GEO_URL"] = stub.geo_url
+    import config
+    import weather_api
+    from resilience import CircuitOpenError
+
+    client = weather_api.weather_client
+    breaker = client.breaker
+    await client.start()
+
+    async def direct(i):
+        status, _ = await client.get_json("weather", {"q": f"city{i}", "appid": "x"})
+        return status
+
+    async def attempt(i):
+        try:
+            return await direct(i)
+        except Exception as e:
+            return e
+
+    # deadline: кожен запит, що зависає, завершується не пізніше за бюджет часу
+    stub.fail_rate, stub.fail_mode = 1.0, "hang"
+    elapsed = []
+    for i in range(min(3, config.CIRCUIT_FAILURE_THRESHOLD - 1)):
+        started = time.monotonic()
+        result = await attempt(i)
+        elapsed.append(time.monotonic() - started)
+        check("deadline: зависання завершується помилкою часу", isinstance(result, asyncio.TimeoutError), repr(result))
+    check(
+        "deadline: затримка в межах бюджету",
+        max(elapsed) <= config.OPENWEATHER_DEADLINE + DEADLINE_SLACK,
+        f"max={max(elapsed):.2f}s, бюджет={config.OPENWEATHER_DEADLINE}s",
+    )
+    breaker.record_success()
+
+    # open: після порогу збоїв поспіль запити більше не доходять до OpenWeather
+    stub.fail_mode = "status"
+    for i in range(config.CIRCUIT_FAILURE_THRESHOLD):
+        await attempt(i)
+    check("open: запобіжник розімкнено після порогу збоїв", breaker.state == breaker.OPEN, breaker.state)
+    calls_before = stub.calls
+    results = [await attempt(i) for i in range(10)]
+    check(
+        "open: запити відхиляються одразу",
+        all(isinstance(r, CircuitOpenError) for r in results),
+        f"{sum(isinstance(r, CircuitOpenError) for r in results)}/10",
+    )
+    check("open: жодного звернення до OpenWeather", stub.calls == calls_before, f"{stub.calls - calls_before}")
+
+    # probe: OpenWeather відновився; пробний запит повільний, тож решта приходять, поки він триває
+    stub.fail_rate, stub.latency = 0.0, 0.2
+    await asyncio.sleep(config.CIRCUIT_RESET_TIMEOUT)
+    calls_before = stub.calls
+    results = await asyncio.gather(*(attempt(i) for i in range(10)))
+    passed = [r for r in results if r == 200]
+    check("probe: пропущено рівно один запит", len(passed) == 1, f"{len(passed)} з 10")
+    check("probe: решту відхилено", sum(isinstance(r, CircuitOpenError) for r in results) == 9)
+    check("probe: одне звернення до OpenWeather", stub.calls - calls_before == 1, f"{stub.calls - calls_before}")
+    check("probe: успіх замкнув запобіжник", breaker.state == breaker.CLOSED, breaker.state)
+
+    # stale: прогріваємо кеш, дані старіють, OpenWeather лежить, запобіжник розімкнено
+    stub.latency = 0.005
+    cities = [f"Місто{i}" for i in range(5)]
+    for city in cities:
+        await weather_api.get_current_weather(city)
+    cache = weather_api.current_cache
+    for entry in cache._data.values():
+        entry[0] -= cache.ttl
+    stub.fail_rate = 1.0
+    for i in range(config.CIRCUIT_FAILURE_THRESHOLD):
+        await attempt(i)
+    check("stale: запобіжник розімкнено", breaker.state == breaker.OPEN, breaker.state)
+    stale_before, calls_before = cache.stale_on_error, stub.calls
+    texts = [await weather_api.get_current_weather(city) for city in cities]
+    check(
+        "stale: міста з кешу віддаються зі старими даними",
+        all(not text.startswith("⚠️") for text in texts),
+        f"{sum(not text.startswith('⚠️') for text in texts)}/{len(cities)}",
+    )
+    check("stale: лічильник stale_on_error", cache.stale_on_error - stale_before == len(cities))
+    check("stale: жодного звернення до OpenWeather", stub.calls == calls_before, f"{stub.calls - calls_before}")
+    text = await weather_api.get_current_weather("Місто без кешу")
+    check("stale: місто без кешу отримує попередження", text.startswith("⚠️"), text)
+
+    # Довідкові виміри: повтори з джитером ховають частину збоїв, бюджет обмежує зависання
+    stub.fail_rate = 0.0
+    await asyncio.sleep(config.CIRCUIT_RESET_TIMEOUT)
+    await direct(0)
+    stub.fail_rate, stub.fail_mode = 0.3, "status"
+    await measure("flaky", count, direct)
+    stub.fail_rate, stub.fail_mode = 0.1, "hang"
+    await measure("hang", count // 4, direct)
+    print(f"  клієнт: {weather_api.get_upstream_stats()}")
+    print(f"  кеш: {cache.stats()}")
+
+    await client.close()
+    await stub.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=200, help="кількість запитів у довідкових вимірах")
+    args = parser.parse_args()
+    asyncio.run(main_async(args.requests))
+    if failures:
+        print(f"Не пройдено перевірок: {len(failures)}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
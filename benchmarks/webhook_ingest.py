@@ -0,0 +1,106 @@
+"""Мікробенчмарк розбору webhook: оновлень/с до та після полегшення гарячого шляху.
+
+"before" відтворює колишній handle_webhook: json.loads, п'ять рядків INFO
+(один з повним payload), Update(**data) і повторна валідація Update у
+диспетчері (бо оновлення не було прив'язане до бота).
+"after" — поточний шлях: Update.model_validate_json на сирих байтах з
+контекстом бота і один рядок access-логу.
+
+Запуск з кореня репозиторію:
+    python benchmarks/webhook_ingest.py [--count 20000]
+"""
+import argparse
+import json
+import logging
+import os
+import sys
+import tempfile
+import time
+
+from aiogram import Bot
+from aiogram.types import Update
+
+
+def make_payload(update_id: int) -> bytes:
+    """Типове оновлення: натискання inline-кнопки «Погода зараз»."""
+    user = {"id": 100000 + update_id, "is_bot": False, "first_name": "Тест", "language_code": "uk"}
+    return json.dumps({
+        "update_id": update_id,
+        "callback_query": {
+            "id": str(update_id),
+            "from": user,
+            "chat_instance": "-123456789",
+            "data": "weather_current",
+            "message": {
+                "message_id": 42,
+                "date": 1760000000,
+                "chat": {"id": user["id"], "type": "private", "first_name": "Тест"},
+                "from": {"id": 1, "is_bot": True, "first_name": "WeatherBot"},
+                "text": "Оберіть, яку погоду показати:",
+            },
+        },
+    }, ensure_ascii=False).encode()
+
+
+def ingest_before(body: bytes, bot: Bot, logger: logging.Logger) -> Update:
+    logger.info("Отримано запит до webhook")
+    data = json.loads(body.decode())
+    logger.info(f"Дані webhook: {data}")
+    if not isinstance(data, dict) or "update_id" not in data:
+        raise ValueError("bad update")
+    update = Update(**data)
+    logger.info("Передача оновлення до диспетчера")
+    # Dispatcher.feed_update перестворює Update, якщо він не прив'язаний до бота
+    update = Update.model_validate(update.model_dump(), context={"bot": bot})
+    logger.info("Оновлення оброблено успішно")
+    return update
+
+
+def ingest_after(body: bytes, bot: Bot, logger: logging.Logger) -> Update:
+    started = time.perf_counter()
+    logger.debug("Дані webhook: %s", body)
+    update = Update.model_validate_json(body, context={"bot": bot})
+    logger.info(
+        "webhook update_id=%d status=%d result=%s bytes=%d ms=%.2f",
+        update.update_id, 200, "queued", len(body), (time.perf_counter() - started) * 1000,
+    )
+    return update
+
+
+def run(ingest, payloads, bot, logger) -> float:
+    started = time.perf_counter()
+    for body in payloads:
+        ingest(body, bot, logger)
+    return len(payloads) / (time.perf_counter() - started)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--count", type=int, default=20000, help="кількість оновлень у кожному прогоні")
+    args = parser.parse_args()
+
+    bot = Bot(token="123456:TEST")
+    payloads = [make_payload(i) for i in range(args.count)]
+    # Логи пишуться у тимчасовий файл на рівні INFO, як у продакшені
+    with tempfile.TemporaryDirectory() as tmp:
+        handler = logging.FileHandler(os.path.join(tmp, "webhook.log"), encoding="utf-8")
+        handler.setFormatter(logging.Formatter("%(levelname)s:%(name)s:%(message)s"))
+        logger = logging.getLogger("bench.webhook")
+        logger.addHandler(handler)
+        logger.setLevel(logging.INFO)
+        logger.propagate = False
+
+        for ingest in (ingest_before, ingest_after):
+            run(ingest, payloads[:500], bot, logger)  # прогрів
+        before = run(ingest_before, payloads, bot, logger)
+        after = run(ingest_after, payloads, bot, logger)
+        handler.close()
+
+    print(f"оновлень: {args.count}")
+    print(f"before: {before:10.0f} updates/s")
+    print(f"after:  {after:10.0f} updates/s  (x{after / before:.1f})")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,6 +1,92 @@
 import os
+import socket
 BOT_TOKEN = os.getenv("BOT_TOKEN", "7988184310:AAFEU86dvc5_dOJdLrrB9QDTcm_O1bTWGLU")
 WEBHOOK_URL = os.getenv("WEBHOOK_URL", "https://weather-bot-vqyf.onrender.com/webhook")
 OPENWEATHER_API_KEY = os.getenv("OPENWEATHER_API_KEY", "e0904bca4dfb0fcd415d4a0bc2509201")
 OPENWEATHER_BASE_URL = os.getenv("OPENWEATHER_BASE_URL", "https://api.openweathermap.org/data/2.5/")
-DB_NAME = "weather_bot.db"
\ No newline at end of file
+DB_NAME = "weather_bot.db"
+
+# Налаштування HTTP-клієнта OpenWeather
+# Таймаут однієї спроби; загальний бюджет запиту з усіма повторами — OPENWEATHER_DEADLINE
+OPENWEATHER_TIMEOUT = float(os.getenv("OPENWEATHER_TIMEOUT", "4"))
+OPENWEATHER_CONNECT_TIMEOUT = float(os.getenv("OPENWEATHER_CONNECT_TIMEOUT", "3"))
+OPENWEATHER_POOL_LIMIT = int(os.getenv("OPENWEATHER_POOL_LIMIT", "100"))
+OPENWEATHER_POOL_LIMIT_PER_HOST = int(os.getenv("OPENWEATHER_POOL_LIMIT_PER_HOST", "30"))
+OPENWEATHER_KEEPALIVE_TIMEOUT = float(os.getenv("OPENWEATHER_KEEPALIVE_TIMEOUT", "30"))
+OPENWEATHER_DNS_TTL = int(os.getenv("OPENWEATHER_DNS_TTL", "300"))
+
+# Стійкість до збоїв OpenWeather: повтори, бюджет часу, запобіжник, ліміт одночасних запитів
+OPENWEATHER_DEADLINE = float(os.getenv("OPENWEATHER_DEADLINE", "8"))
+OPENWEATHER_MAX_ATTEMPTS = int(os.getenv("OPENWEATHER_MAX_ATTEMPTS", "3"))
+OPENWEATHER_RETRY_BASE_DELAY = float(os.getenv("OPENWEATHER_RETRY_BASE_DELAY", "0.2"))
+OPENWEATHER_RETRY_MAX_DELAY = float(os.getenv("OPENWEATHER_RETRY_MAX_DELAY", "2"))
+OPENWEATHER_MAX_CONCURRENCY = int(os.getenv("OPENWEATHER_MAX_CONCURRENCY", "20"))
+CIRCUIT_FAILURE_THRESHOLD = int(os.getenv("CIRCUIT_FAILURE_THRESHOLD", "5"))
+CIRCUIT_RESET_TIMEOUT = float(os.getenv("CIRCUIT_RESET_TIMEOUT", "30"))
+
+# Кеш відповідей OpenWeather
+CURRENT_WEATHER_CACHE_TTL = float(os.getenv("CURRENT_WEATHER_CACHE_TTL", "600"))
+FORECAST_CACHE_TTL = float(os.getenv("FORECAST_CACHE_TTL", "3600"))
+WEATHER_CACHE_MAX_SIZE = int(os.getenv("WEATHER_CACHE_MAX_SIZE", "1024"))
+# Оновлення наперед для популярних міст: після частки TTL та віддача застарілих даних під час оновлення
+WEATHER_CACHE_REFRESH_AHEAD = float(os.getenv("WEATHER_CACHE_REFRESH_AHEAD", "0.8"))
+WEATHER_CACHE_STALE_TTL = float(os.getenv("WEATHER_CACHE_STALE_TTL", "300"))
+WEATHER_CACHE_HOT_HITS = int(os.getenv("WEATHER_CACHE_HOT_HITS", "3"))
+# Скільки після закінчення TTL можна віддавати старі дані, якщо OpenWeather недоступний
+WEATHER_CACHE_STALE_IF_ERROR = float(os.getenv("WEATHER_CACHE_STALE_IF_ERROR", "3600"))
+
+# Черга вихідних повідомлень Telegram
+TELEGRAM_GLOBAL_RATE = float(os.getenv("TELEGRAM_GLOBAL_RATE", "30"))
+TELEGRAM_PER_CHAT_INTERVAL = float(os.getenv("TELEGRAM_PER_CHAT_INTERVAL", "1"))
+SEND_WORKERS = int(os.getenv("SEND_WORKERS", "16"))
+SEND_QUEUE_SIZE = int(os.getenv("SEND_QUEUE_SIZE", "20000"))
+SEND_MAX_ATTEMPTS = int(os.getenv("SEND_MAX_ATTEMPTS", "3"))
+
+# Паралельні запити погоди для кількох міст користувача
+CITY_LOOKUP_CONCURRENCY = int(os.getenv("CITY_LOOKUP_CONCURRENCY", "5"))
+CITY_LOOKUP_TIMEOUT = float(os.getenv("CITY_LOOKUP_TIMEOUT", "8"))
+PROGRESSIVE_CITIES_THRESHOLD = int(os.getenv("PROGRESSIVE_CITIES_THRESHOLD", "4"))
+PROGRESSIVE_EDIT_INTERVAL = float(os.getenv("PROGRESSIVE_EDIT_INTERVAL", "1"))
+
+# Індекс підписок у пам'яті замість запиту до бази на кожен тік. Лише для одного екземпляра:
+# зміни часів, зроблені через інший екземпляр, сюди не потрапляють
+IN_MEMORY_SUBSCRIPTIONS = os.getenv("IN_MEMORY_SUBSCRIPTIONS", "0") == "1"
+# Фонове завантаження підписок при старті
+HYDRATION_CHUNK_SIZE = int(os.getenv("HYDRATION_CHUNK_SIZE", "5000"))
+# Повтори завантаження при помилці бази: затримка подвоюється до максимуму
+HYDRATION_RETRY_DELAY = float(os.getenv("HYDRATION_RETRY_DELAY", "1"))
+HYDRATION_RETRY_MAX_DELAY = float(os.getenv("HYDRATION_RETRY_MAX_DELAY", "60"))
+
+# Черга вхідних оновлень webhook: UPDATE_WORKERS шардів за чатом, UPDATE_QUEUE_SIZE — сумарна місткість
+UPDATE_WORKERS = int(os.getenv("UPDATE_WORKERS", "8"))
+UPDATE_QUEUE_SIZE = int(os.getenv("UPDATE_QUEUE_SIZE", "1000"))
+UPDATE_DEDUP_SIZE = int(os.getenv("UPDATE_DEDUP_SIZE", "10000"))
+
+# Частка оновлень webhook, тіло яких логується на рівні INFO (решта лише на DEBUG)
+WEBHOOK_LOG_SAMPLE_RATE = float(os.getenv("WEBHOOK_LOG_SAMPLE_RATE", "0"))
+
+# Прогрів кешу перед слотами сповіщень
+PREFETCH_LEAD_MINUTES = int(os.getenv("PREFETCH_LEAD_MINUTES", "2"))
+PREFETCH_RATE = float(os.getenv("PREFETCH_RATE", "5"))
+PREFETCH_MIN_USERS = int(os.getenv("PREFETCH_MIN_USERS", "5"))
+
+# Геокодування назв міст
+OPENWEATHER_GEO_URL = os.getenv("OPENWEATHER_GEO_URL", "https://api.openweathermap.org/geo/1.0/")
+# Фонове догеокодування міст, збережених за назвою: запитів/с, розмір пачки, паузи між проходами
+CITY_BACKFILL_RATE = float(os.getenv("CITY_BACKFILL_RATE", "2"))
+CITY_BACKFILL_BATCH = int(os.getenv("CITY_BACKFILL_BATCH", "200"))
+CITY_BACKFILL_INTERVAL = float(os.getenv("CITY_BACKFILL_INTERVAL", "3600"))
+CITY_BACKFILL_RETRY_DELAY = float(os.getenv("CITY_BACKFILL_RETRY_DELAY", "60"))
+
+# Журнал доставки та розподіл роботи між екземплярами.
+# INSTANCE_ID має бути стабільним між рестартами, щоб після падіння екземпляр одразу звільнив
+# свою оренду; за замовчуванням — ім'я хоста (кілька екземплярів на одному хості задають його явно).
+# Оренда коротка й продовжується, поки доставка чекає в черзі, тож чужі доставки досилаються швидко
+INSTANCE_ID = os.getenv("INSTANCE_ID") or socket.gethostname()
+DELIVERY_LEASE_SECONDS = float(os.getenv("DELIVERY_LEASE_SECONDS", "120"))
+DELIVERY_CLAIM_BATCH = int(os.getenv("DELIVERY_CLAIM_BATCH", "500"))
+DELIVERY_RESUME_MINUTES = int(os.getenv("DELIVERY_RESUME_MINUTES", "60"))
+DELIVERY_LOG_RETENTION_DAYS = int(os.getenv("DELIVERY_LOG_RETENTION_DAYS", "7"))
+
+# Адреса Bot API (порожньо — api.telegram.org); для локального Bot API сервера або заглушки в бенчмарках
+TELEGRAM_API_URL = os.getenv("TELEGRAM_API_URL", "")
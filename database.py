@@ -1,56 +1,443 @@
+import asyncio
 import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from config import DB_NAME
+from utils import normalize_city, split_csv, time_to_minute, minute_to_time
 
-def init_db():
-    """Ініціалізація таблиці user_settings, якщо не створена."""
-    conn = sqlite3.connect(DB_NAME)
-    cursor = conn.cursor()
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS user_settings (
-            user_id INTEGER PRIMARY KEY,
-            city TEXT,
-            notify_times TEXT
+# Одне постійне з'єднання замість sqlite3.connect() на кожен запит.
+# Усі async-варіанти виконуються в окремому потоці, щоб не блокувати цикл подій.
+_conn = None
+_lock = threading.Lock()
+_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="sqlite")
+
+# SQL тримаємо в константах: sqlite3 кешує скомпільовані (prepared) запити за текстом
+SQL_ENSURE_USER = "INSERT OR IGNORE INTO user_settings (user_id) VALUES (?)"
+SQL_DELETE_USER_CITIES = "DELETE FROM user_cities WHERE user_id = ?"
+SQL_INSERT_USER_CITY = "INSERT INTO user_cities (user_id, city_key, position, name) VALUES (?, ?, ?, ?)"
+SQL_GET_USER_CITIES = "SELECT city_key, name FROM user_cities WHERE user_id = ? ORDER BY position"
+SQL_DELETE_USER_NOTIFY_TIMES = "DELETE FROM user_notify_times WHERE user_id = ?"
+SQL_INSERT_USER_NOTIFY_TIME = "INSERT OR IGNORE INTO user_notify_times (user_id, minute_of_day) VALUES (?, ?)"
+SQL_GET_USER_NOTIFY_TIMES = "SELECT minute_of_day FROM user_notify_times WHERE user_id = ? ORDER BY minute_of_day"
+SQL_GET_USERS_DUE_AT = """
+    SELECT t.user_id FROM user_notify_times AS t JOIN user_settings AS s ON s.user_id = t.user_id
+    WHERE t.minute_of_day = ? AND s.blocked = 0
+"""
+SQL_SET_USER_BLOCKED = "UPDATE user_settings SET blocked = ? WHERE user_id = ?"
+SQL_GET_CITY_SUBSCRIBERS = "SELECT DISTINCT user_id FROM user_cities WHERE city_key = ?"
+SQL_GET_ALL_CITIES = "SELECT city_key, name, lat, lon, country FROM cities"
+SQL_GET_CITY = "SELECT city_key, name, lat, lon, country FROM cities WHERE city_key = ?"
+SQL_GET_ALL_CITY_ALIASES = "SELECT alias, city_key FROM city_aliases"
+SQL_UPSERT_CITY = """
+    INSERT INTO cities (city_key, name, lat, lon, country) VALUES (?, ?, ?, ?, ?)
+    ON CONFLICT(city_key) DO UPDATE SET name=excluded.name, lat=excluded.lat, lon=excluded.lon, country=excluded.country
+"""
+# Псевдонім, що вже вказує на інше місто, не перепризначаємо: ним користуються інші підписки
+SQL_INSERT_CITY_ALIAS = "INSERT OR IGNORE INTO city_aliases (alias, city_key) VALUES (?, ?)"
+SQL_GET_UNRESOLVED_CITIES = """
+    SELECT city_key, MIN(name) FROM user_cities
+    WHERE city_key NOT LIKE 'geo:%' AND city_key > ?
+    GROUP BY city_key ORDER BY city_key LIMIT ?
+"""
+SQL_RESOLVE_USER_CITY = "UPDATE user_cities SET city_key = ?, name = ? WHERE city_key = ?"
+# Якщо в користувача після геокодування два записи одного міста («київ» і «kyiv»), лишаємо перший
+SQL_DEDUPE_USER_CITY = """
+    DELETE FROM user_cities WHERE city_key = ? AND position > (
+        SELECT MIN(position) FROM user_cities AS first
+        WHERE first.user_id = user_cities.user_id AND first.city_key = user_cities.city_key
+    )
+"""
+# Користувачам, що заблокували бота, доставки не створюються (незалежно від того, звідки взято список)
+SQL_CREATE_DELIVERY = """
+    INSERT OR IGNORE INTO deliveries (date, slot, user_id, updated_at)
+    SELECT ?, ?, ?, ? WHERE NOT EXISTS (SELECT 1 FROM user_settings WHERE user_id = ? AND blocked = 1)
+"""
+SQL_CLAIM_DELIVERIES = """
+    UPDATE deliveries SET owner = ?, lease_until = ?, attempts = attempts + 1, updated_at = ?
+    WHERE rowid IN (
+        SELECT rowid FROM deliveries
+        WHERE date = ? AND slot = ? AND status = 'pending' AND (lease_until IS NULL OR lease_until < ?)
+        LIMIT ?
+    )
+    RETURNING user_id
+"""
+SQL_FINISH_DELIVERY = """
+    UPDATE deliveries SET status = ?, lease_until = NULL, updated_at = ?
+    WHERE date = ? AND slot = ? AND user_id = ? AND owner = ?
+"""
+SQL_GET_PENDING_SLOTS = """
+    SELECT DISTINCT slot FROM deliveries
+    WHERE date = ? AND slot BETWEEN ? AND ? AND status = 'pending' AND (lease_until IS NULL OR lease_until < ?)
+"""
+SQL_PRUNE_DELIVERIES = "DELETE FROM deliveries WHERE date < ?"
+SQL_RENEW_LEASE = """
+    UPDATE deliveries SET lease_until = ?
+    WHERE date = ? AND slot = ? AND user_id = ? AND owner = ? AND status = 'pending'
+"""
+SQL_RELEASE_LEASES = "UPDATE deliveries SET lease_until = NULL WHERE owner = ? AND status = 'pending'"
+SQL_COUNT_NOTIFY_TIMES = "SELECT COUNT(*) FROM user_notify_times"
+SQL_GET_NOTIFY_TIMES_CHUNK = """
+    SELECT user_id, minute_of_day FROM user_notify_times
+    WHERE (user_id, minute_of_day) > (?, ?)
+    ORDER BY user_id, minute_of_day
+    LIMIT ?
+"""
+
+# Міграції схеми за PRAGMA user_version; кожен елемент переводить базу на наступну версію
+def _migrate_normalized_subscriptions(conn: sqlite3.Connection):
+    """v1: міста й часи сповіщень у дочірніх таблицях замість рядків через кому."""
+    conn.executescript("""
+        CREATE TABLE IF NOT EXISTS user_cities (
+            user_id INTEGER NOT NULL,
+            city_key TEXT NOT NULL,
+            position INTEGER NOT NULL,
+            name TEXT NOT NULL,
+            PRIMARY KEY (user_id, position)
+        );
+        CREATE INDEX IF NOT EXISTS idx_user_cities_city_key ON user_cities (city_key);
+        CREATE TABLE IF NOT EXISTS user_notify_times (
+            user_id INTEGER NOT NULL,
+            minute_of_day INTEGER NOT NULL,
+            PRIMARY KEY (user_id, minute_of_day)
+        );
+        CREATE INDEX IF NOT EXISTS idx_user_notify_times_minute ON user_notify_times (minute_of_day);
+    """)
+    # Переносимо наявні дані; старі колонки user_settings.city/notify_times більше не оновлюються
+    for user_id, city, notify_times in conn.execute("SELECT user_id, city, notify_times FROM user_settings").fetchall():
+        for position, name in enumerate(split_csv(city)):
+            conn.execute(SQL_INSERT_USER_CITY, (user_id, normalize_city(name), position, name))
+        for time_str in split_csv(notify_times):
+            conn.execute(SQL_INSERT_USER_NOTIFY_TIME, (user_id, time_to_minute(time_str)))
+
+def _migrate_city_directory(conn: sqlite3.Connection):
+    """v2: довідник геокодованих міст і псевдонімів (введених назв) для них."""
+    conn.executescript("""
+        CREATE TABLE IF NOT EXISTS cities (
+            city_key TEXT PRIMARY KEY,
+            name TEXT NOT NULL,
+            lat REAL NOT NULL,
+            lon REAL NOT NULL,
+            country TEXT
+        );
+        CREATE TABLE IF NOT EXISTS city_aliases (
+            alias TEXT PRIMARY KEY,
+            city_key TEXT NOT NULL REFERENCES cities (city_key)
         );
     """)
-    conn.commit()
-    conn.close()
-
-def get_user_settings(user_id: int):
-    """Повертає (city, notify_times) для заданого user_id або (None, None)."""
-    conn = sqlite3.connect(DB_NAME)
-    cursor = conn.cursor()
-    cursor.execute("SELECT city, notify_times FROM user_settings WHERE user_id = ?", (user_id,))
-    row = cursor.fetchone()
-    conn.close()
-    return (row[0], row[1]) if row else (None, None)
-
-def set_city(user_id: int, city: str):
-    """Зберігає або оновлює місто користувача."""
-    conn = sqlite3.connect(DB_NAME)
-    cursor = conn.cursor()
-    cursor.execute("""
-        INSERT INTO user_settings (user_id, city, notify_times) VALUES (?, ?, ?)
-        ON CONFLICT(user_id) DO UPDATE SET city=excluded.city
-    """, (user_id, city, None))  # notify_times залишається None, якщо не встановлено
-    conn.commit()
-    conn.close()
-
-def set_notify_times(user_id: int, notify_times: str):
-    """Зберігає або оновлює список часів сповіщень (формат HH:MM через кому)."""
-    conn = sqlite3.connect(DB_NAME)
-    cursor = conn.cursor()
-    cursor.execute("""
-        INSERT INTO user_settings (user_id, notify_times) VALUES (?, ?)
-        ON CONFLICT(user_id) DO UPDATE SET notify_times=excluded.notify_times
-    """, (user_id, notify_times))
-    conn.commit()
-    conn.close()
-
-def get_all_users():
-    """Повертає список (user_id, city, notify_times) для всіх користувачів."""
-    conn = sqlite3.connect(DB_NAME)
-    cursor = conn.cursor()
-    cursor.execute("SELECT user_id, city, notify_times FROM user_settings")
-    rows = cursor.fetchall()
-    conn.close()
-    return rows
\ No newline at end of file
+
+def _migrate_delivery_log(conn: sqlite3.Connection):
+    """v3: журнал доставки сповіщень для ідемпотентної розсилки кількома екземплярами."""
+    conn.executescript("""
+        CREATE TABLE IF NOT EXISTS deliveries (
+            date TEXT NOT NULL,
+            slot INTEGER NOT NULL,
+            user_id INTEGER NOT NULL,
+            status TEXT NOT NULL DEFAULT 'pending',
+            owner TEXT,
+            lease_until REAL,
+            attempts INTEGER NOT NULL DEFAULT 0,
+            updated_at REAL,
+            PRIMARY KEY (date, slot, user_id)
+        );
+        CREATE INDEX IF NOT EXISTS idx_deliveries_pending ON deliveries (date, status, slot);
+    """)
+
+def _migrate_blocked_users(conn: sqlite3.Connection):
+    """v4: позначка користувачів, що заблокували бота, спільна для всіх екземплярів і рестартів."""
+    conn.execute("ALTER TABLE user_settings ADD COLUMN blocked INTEGER NOT NULL DEFAULT 0")
+    # Переносимо з журналу доставки: заблокований, якщо остання спроба надіслати завершилась blocked
+    conn.execute("""
+        UPDATE user_settings SET blocked = 1 WHERE user_id IN (
+            SELECT d.user_id FROM deliveries AS d
+            WHERE d.status = 'blocked' AND d.updated_at = (
+                SELECT MAX(updated_at) FROM deliveries
+                WHERE user_id = d.user_id AND status IN ('sent', 'blocked')
+            )
+        )
+    """)
+
+MIGRATIONS = [
+    _migrate_normalized_subscriptions,
+    _migrate_city_directory,
+    _migrate_delivery_log,
+    _migrate_blocked_users,
+]
+
+def get_connection() -> sqlite3.Connection:
+    """Повертає спільне з'єднання, створюючи його з WAL та налаштованими pragma."""
+    global _conn
+    if _conn is None:
+        conn = sqlite3.connect(DB_NAME, check_same_thread=False, cached_statements=256)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA cache_size=-16000")  # ~16 МБ сторінкового кешу
+        conn.execute("PRAGMA temp_store=MEMORY")
+        conn.execute("PRAGMA busy_timeout=5000")
+        _conn = conn
+    return _conn
+
+def close_db():
+    """Закриває спільне з'єднання (викликається при зупинці бота)."""
+    global _conn
+    with _lock:
+        if _conn is not None:
+            _conn.close()
+            _conn = None
+
+async def run_db(func, *args):
+    """Виконує синхронну функцію бази даних у виділеному потоці."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_executor, func, *args)
+
+def init_db():
+    """Ініціалізація таблиць і застосування міграцій схеми."""
+    with _lock:
+        conn = get_connection()
+        with conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS user_settings (
+                    user_id INTEGER PRIMARY KEY,
+                    city TEXT,
+                    notify_times TEXT
+                );
+            """)
+        version = conn.execute("PRAGMA user_version").fetchone()[0]
+        for number, migration in enumerate(MIGRATIONS[version:], start=version + 1):
+            with conn:
+                migration(conn)
+                conn.execute(f"PRAGMA user_version = {number}")
+
+def set_cities(user_id: int, cities: list):
+    """Зберігає міста користувача [(city_key, name), ...] в заданому порядку (замінює попередні)."""
+    with _lock:
+        conn = get_connection()
+        with conn:
+            conn.execute(SQL_ENSURE_USER, (user_id,))
+            conn.execute(SQL_DELETE_USER_CITIES, (user_id,))
+            conn.executemany(SQL_INSERT_USER_CITY, [
+                (user_id, city_key, position, name) for position, (city_key, name) in enumerate(cities)
+            ])
+
+def get_user_cities(user_id: int) -> list:
+    """Повертає міста користувача [(city_key, name), ...] в порядку введення."""
+    with _lock:
+        return get_connection().execute(SQL_GET_USER_CITIES, (user_id,)).fetchall()
+
+def set_notify_times(user_id: int, times: list):
+    """Зберігає часи сповіщень користувача (список "HH:MM", замінює попередній)."""
+    with _lock:
+        conn = get_connection()
+        with conn:
+            conn.execute(SQL_ENSURE_USER, (user_id,))
+            conn.execute(SQL_DELETE_USER_NOTIFY_TIMES, (user_id,))
+            conn.executemany(SQL_INSERT_USER_NOTIFY_TIME, [(user_id, time_to_minute(t)) for t in times])
+
+def get_user_notify_times(user_id: int) -> list:
+    """Повертає часи сповіщень користувача як список "HH:MM"."""
+    with _lock:
+        rows = get_connection().execute(SQL_GET_USER_NOTIFY_TIMES, (user_id,)).fetchall()
+    return [minute_to_time(row[0]) for row in rows]
+
+def get_users_due_at(minute_of_day: int) -> list:
+    """Повертає user_id усіх, кому треба надіслати сповіщення о цій хвилині доби."""
+    with _lock:
+        return [row[0] for row in get_connection().execute(SQL_GET_USERS_DUE_AT, (minute_of_day,))]
+
+def get_city_subscribers(city_key: str) -> list:
+    """Повертає user_id усіх, хто стежить за містом (city_key — ключ із довідника міст)."""
+    with _lock:
+        return [row[0] for row in get_connection().execute(SQL_GET_CITY_SUBSCRIBERS, (city_key,))]
+
+def get_users_cities(user_ids) -> dict:
+    """Повертає {user_id: [(city_key, name), ...]} для кількох користувачів пачками."""
+    user_ids = list(user_ids)
+    result = {}
+    with _lock:
+        conn = get_connection()
+        for i in range(0, len(user_ids), 500):
+            chunk = user_ids[i:i + 500]
+            placeholders = ",".join("?" * len(chunk))
+            rows = conn.execute(
+                f"SELECT user_id, city_key, name FROM user_cities WHERE user_id IN ({placeholders}) "
+                f"ORDER BY user_id, position", chunk
+            )
+            for user_id, city_key, name in rows:
+                result.setdefault(user_id, []).append((city_key, name))
+    return result
+
+def get_city_directory():
+    """Повертає (міста, псевдоніми) для побудови індексу в пам'яті."""
+    with _lock:
+        conn = get_connection()
+        return conn.execute(SQL_GET_ALL_CITIES).fetchall(), conn.execute(SQL_GET_ALL_CITY_ALIASES).fetchall()
+
+def get_city(city_key: str):
+    """Повертає (city_key, name, lat, lon, country) з довідника міст або None."""
+    with _lock:
+        return get_connection().execute(SQL_GET_CITY, (city_key,)).fetchone()
+
+def save_city(city_key: str, name: str, lat: float, lon: float, country: str, aliases: list):
+    """Зберігає геокодоване місто та введені назви, що на нього вказують."""
+    with _lock:
+        conn = get_connection()
+        with conn:
+            conn.execute(SQL_UPSERT_CITY, (city_key, name, lat, lon, country))
+            conn.executemany(SQL_INSERT_CITY_ALIAS, [(alias, city_key) for alias in aliases])
+
+def get_unresolved_cities(after: str, limit: int) -> list:
+    """Міста користувачів, збережені за назвою (ключ не geo:...): [(city_key, name), ...] після ключа after."""
+    with _lock:
+        return get_connection().execute(SQL_GET_UNRESOLVED_CITIES, (after, limit)).fetchall()
+
+def resolve_user_city(old_key: str, city_key: str, name: str) -> int:
+    """Переводить усі записи міста old_key на геокодований city_key; повертає кількість оновлених рядків."""
+    with _lock:
+        conn = get_connection()
+        with conn:
+            updated = conn.execute(SQL_RESOLVE_USER_CITY, (city_key, name, old_key)).rowcount
+            conn.execute(SQL_DEDUPE_USER_CITY, (city_key,))
+    return updated
+
+def create_deliveries(date: str, slot: int, user_ids):
+    """Записує очікувані доставки слоту; повторний виклик (інший екземпляр, рестарт) нічого не дублює."""
+    now = time.time()
+    with _lock:
+        conn = get_connection()
+        with conn:
+            conn.executemany(SQL_CREATE_DELIVERY, [(date, slot, user_id, now, user_id) for user_id in user_ids])
+
+def claim_deliveries(date: str, slot: int, owner: str, lease_seconds: float, limit: int) -> list:
+    """Атомарно бере в оренду до limit невідправлених доставок слоту; повертає їхні user_id."""
+    now = time.time()
+    with _lock:
+        conn = get_connection()
+        with conn:
+            rows = conn.execute(SQL_CLAIM_DELIVERIES, (owner, now + lease_seconds, now, date, slot, now, limit)).fetchall()
+    return [row[0] for row in rows]
+
+def finish_delivery(date: str, slot: int, user_id: int, owner: str, status: str):
+    """Фіксує результат доставки (sent/failed/blocked/skipped), якщо оренда ще наша.
+
+    blocked також позначає користувача заблокованим, щоб жоден екземпляр більше йому не надсилав.
+    """
+    with _lock:
+        conn = get_connection()
+        with conn:
+            conn.execute(SQL_FINISH_DELIVERY, (status, time.time(), date, slot, user_id, owner))
+            if status == "blocked":
+                conn.execute(SQL_SET_USER_BLOCKED, (1, user_id))
+
+def set_user_blocked(user_id: int, blocked: bool):
+    """Позначає, чи заблокував користувач бота (знімається, коли він знову пише боту)."""
+    with _lock:
+        conn = get_connection()
+        with conn:
+            conn.execute(SQL_SET_USER_BLOCKED, (int(blocked), user_id))
+
+def get_pending_slots(date: str, from_slot: int, to_slot: int) -> list:
+    """Слоти дня з невідправленими доставками, оренда яких вільна або прострочена."""
+    with _lock:
+        rows = get_connection().execute(SQL_GET_PENDING_SLOTS, (date, from_slot, to_slot, time.time())).fetchall()
+    return [row[0] for row in rows]
+
+def renew_leases(owner: str, deliveries: list, lease_seconds: float):
+    """Продовжує оренду доставок [(date, slot, user_id), ...], які екземпляр ще не відправив."""
+    lease_until = time.time() + lease_seconds
+    with _lock:
+        conn = get_connection()
+        with conn:
+            conn.executemany(SQL_RENEW_LEASE, [
+                (lease_until, date, slot, user_id, owner) for date, slot, user_id in deliveries
+            ])
+
+def release_leases(owner: str):
+    """Знімає оренду з невідправлених доставок екземпляра, щоб їх одразу могли досилати."""
+    with _lock:
+        conn = get_connection()
+        with conn:
+            conn.execute(SQL_RELEASE_LEASES, (owner,))
+
+def prune_deliveries(before_date: str):
+    """Видаляє журнал доставки, старший за before_date."""
+    with _lock:
+        conn = get_connection()
+        with conn:
+            conn.execute(SQL_PRUNE_DELIVERIES, (before_date,))
+
+def count_notify_times() -> int:
+    """Кількість усіх підписок (user_id, хвилина доби)."""
+    with _lock:
+        return get_connection().execute(SQL_COUNT_NOTIFY_TIMES).fetchone()[0]
+
+def get_notify_times_chunk(after: tuple, limit: int) -> list:
+    """Повертає наступну пачку (user_id, minute_of_day) після ключа after (keyset-пагінація)."""
+    with _lock:
+        return get_connection().execute(SQL_GET_NOTIFY_TIMES_CHUNK, (*after, limit)).fetchall()
+
+# Async-варіанти для обробників і планувальника
+async def set_cities_async(user_id: int, cities: list):
+    await run_db(set_cities, user_id, cities)
+
+async def get_user_cities_async(user_id: int) -> list:
+    return await run_db(get_user_cities, user_id)
+
+async def set_notify_times_async(user_id: int, times: list):
+    await run_db(set_notify_times, user_id, times)
+
+async def get_user_notify_times_async(user_id: int) -> list:
+    return await run_db(get_user_notify_times, user_id)
+
+async def get_users_due_at_async(minute_of_day: int) -> list:
+    return await run_db(get_users_due_at, minute_of_day)
+
+async def get_city_subscribers_async(city_key: str) -> list:
+    return await run_db(get_city_subscribers, city_key)
+
+async def get_users_cities_async(user_ids) -> dict:
+    return await run_db(get_users_cities, user_ids)
+
+async def get_city_directory_async():
+    return await run_db(get_city_directory)
+
+async def get_city_async(city_key: str):
+    return await run_db(get_city, city_key)
+
+async def save_city_async(city_key: str, name: str, lat: float, lon: float, country: str, aliases: list):
+    await run_db(save_city, city_key, name, lat, lon, country, aliases)
+
+async def get_unresolved_cities_async(after: str, limit: int) -> list:
+    return await run_db(get_unresolved_cities, after, limit)
+
+async def resolve_user_city_async(old_key: str, city_key: str, name: str) -> int:
+    return await run_db(resolve_user_city, old_key, city_key, name)
+
+async def create_deliveries_async(date: str, slot: int, user_ids):
+    await run_db(create_deliveries, date, slot, list(user_ids))
+
+async def claim_deliveries_async(date: str, slot: int, owner: str, lease_seconds: float, limit: int) -> list:
+    return await run_db(claim_deliveries, date, slot, owner, lease_seconds, limit)
+
+async def finish_delivery_async(date: str, slot: int, user_id: int, owner: str, status: str):
+    await run_db(finish_delivery, date, slot, user_id, owner, status)
+
+async def set_user_blocked_async(user_id: int, blocked: bool):
+    await run_db(set_user_blocked, user_id, blocked)
+
+async def get_pending_slots_async(date: str, from_slot: int, to_slot: int) -> list:
+    return await run_db(get_pending_slots, date, from_slot, to_slot)
+
+async def renew_leases_async(owner: str, deliveries: list, lease_seconds: float):
+    await run_db(renew_leases, owner, deliveries, lease_seconds)
+
+async def release_leases_async(owner: str):
+    await run_db(release_leases, owner)
+
+async def prune_deliveries_async(before_date: str):
+    await run_db(prune_deliveries, before_date)
+
+async def count_notify_times_async() -> int:
+    return await run_db(count_notify_times)
+
+async def get_notify_times_chunk_async(after: tuple, limit: int) -> list:
+    return await run_db(get_notify_times_chunk, after, limit)
@@ -0,0 +1,160 @@
+import asyncio
+import logging
+from config import (
+    OPENWEATHER_API_KEY, OPENWEATHER_GEO_URL, CITY_BACKFILL_RATE, CITY_BACKFILL_BATCH, CITY_BACKFILL_INTERVAL,
+    CITY_BACKFILL_RETRY_DELAY,
+)
+from database import get_city_directory_async, get_city_async, save_city_async, get_unresolved_cities_async, resolve_user_city_async
+from models import City
+from utils import normalize_city
+
+logger = logging.getLogger(__name__)
+
+
+def city_key(lat: float, lon: float) -> str:
+    """Канонічний ключ міста за координатами (~1 км), спільний для всіх варіантів назви."""
+    return f"geo:{lat:.2f},{lon:.2f}"
+
+
+class OpenWeatherGeocoder:
+    """Геокодер OpenWeather (/geo/1.0/direct): назва -> City або None, якщо місто не знайдено."""
+
+    def __init__(self, client, base_url: str = OPENWEATHER_GEO_URL, lang: str = "uk"):
+        self.client = client
+        self.base_url = base_url
+        self.lang = lang
+
+    async def __call__(self, name: str):
+        params = {"q": name, "limit": 1, "appid": OPENWEATHER_API_KEY}
+        status, data = await self.client.get_json("direct", params, base_url=self.base_url)
+        if status != 200 or not data:
+            return None
+        place = data[0]
+        lat, lon = place["lat"], place["lon"]
+        local_name = place.get("local_names", {}).get(self.lang) or place["name"]
+        return City(city_key(lat, lon), local_name, lat, lon, place.get("country"))
+
+
+class CityResolver:
+    """Перетворює введені назви міст на канонічні City з координатами.
+
+    Кожна назва геокодується лише один раз: результат зберігається в SQLite
+    (таблиці cities/city_aliases) та в індексі в пам'яті, тож подальші запити
+    погоди йдуть за координатами. Псевдонім, що вже належить іншому місту,
+    не перепризначається: «Олександрія» лишається тим містом, яке обрали першим,
+    а підписки користувачів тримаються ключа міста, а не назви. geocoder — будь-який async callable
+    name -> City | None, тож у тестах його легко підмінити.
+    """
+
+    def __init__(self, geocoder):
+        self.geocoder = geocoder
+        self._by_alias = {}  # нормалізована назва -> City
+        self._by_key = {}  # ключ міста -> City
+        self.loaded = False
+        self.upstream_lookups = 0
+
+    async def load(self):
+        """Завантажує довідник міст із бази в пам'ять."""
+        cities, aliases = await get_city_directory_async()
+        self._by_key.update((row[0], City(*row)) for row in cities)
+        for alias, key in aliases:
+            if key in self._by_key:
+                self._by_alias[alias] = self._by_key[key]
+        self.loaded = True
+
+    def lookup(self, name: str):
+        """Шукає місто лише в індексі в пам'яті (без запитів назовні)."""
+        return self._by_alias.get(normalize_city(name))
+
+    async def locate(self, key: str):
+        """Повертає City за ключем міста з індексу або з бази (місто міг геокодувати інший екземпляр).
+
+        None — ключ не з довідника (назва, збережена без геокодування).
+        """
+        city = self._by_key.get(key)
+        if city is None and key.startswith("geo:"):
+            row = await get_city_async(key)
+            if row is not None:
+                city = self._by_key[key] = City(*row)
+        return city
+
+    async def resolve(self, name: str):
+        """Повертає City для назви, за потреби геокодуючи її; None — місто не знайдено."""
+        city = self.lookup(name)
+        if city is not None:
+            return city
+        self.upstream_lookups += 1
+        city = await self.geocoder(name)
+        if city is None:
+            return None
+        aliases = {normalize_city(name), normalize_city(city.name)}
+        await save_city_async(city.key, city.name, city.lat, city.lon, city.country, list(aliases))
+        self._by_key[city.key] = city
+        for alias in aliases:
+            self._by_alias.setdefault(alias, city)
+        return city
+
+    def stats(self) -> dict:
+        return {"cities": len(self._by_key), "aliases": len(self._by_alias), "upstream_lookups": self.upstream_lookups}
+
+
+# Стан фонового догеокодування (для /health)
+backfill_stats = {
+    "passes": 0,
+    "resolved_cities": 0,
+    "updated_rows": 0,
+    "not_found": 0,
+    "errors": 0,
+    "pending": None,
+}
+
+
+async def _backfill_pass(resolver: CityResolver, rate: float, batch: int, skip: set) -> int:
+    """Один прохід по містах, збережених за назвою; повертає кількість помилок геокодера."""
+    errors = 0
+    pending = 0
+    after = ""
+    while True:
+        rows = await get_unresolved_cities_async(after, batch)
+        if not rows:
+            break
+        after = rows[-1][0]
+        for old_key, name in rows:
+            if old_key in skip:
+                continue
+            lookups = resolver.upstream_lookups
+            try:
+                city = await resolver.resolve(name)
+            except Exception as e:
+                errors += 1
+                pending += 1
+                backfill_stats["errors"] += 1
+                logger.warning(f"Догеокодування {name!r} не вдалося: {e}")
+                continue
+            finally:
+                if resolver.upstream_lookups != lookups:
+                    await asyncio.sleep(1 / rate)
+            if city is None:
+                # Назву не знайдено — лишаємо запис як є і більше не питаємо геокодер
+                skip.add(old_key)
+                backfill_stats["not_found"] += 1
+                continue
+            backfill_stats["resolved_cities"] += 1
+            backfill_stats["updated_rows"] += await resolve_user_city_async(old_key, city.key, city.name)
+    backfill_stats["passes"] += 1
+    backfill_stats["pending"] = pending
+    return errors
+
+
+async def backfill_city_keys(resolver: CityResolver, rate: float = CITY_BACKFILL_RATE, batch: int = CITY_BACKFILL_BATCH,
+                             interval: float = CITY_BACKFILL_INTERVAL, retry_delay: float = CITY_BACKFILL_RETRY_DELAY):
+    """Фоново геокодує міста користувачів, збережені за назвою, щоб погода запитувалась за координатами.
+
+    Такі записи лишилися з часів до довідника міст або з'явилися, коли геокодер
+    був недоступний під час введення. Запити до геокодера обмежені rate за секунду;
+    після проходу з помилками наступний починається через retry_delay, інакше через interval.
+    """
+    skip = set()
+    while True:
+        errors = await _backfill_pass(resolver, rate, batch, skip)
+        await asyncio.sleep(retry_delay if errors else interval)
@@ -1,14 +1,25 @@
 import re
+import asyncio
+import logging
+import time
 from aiogram import Router, F
 from aiogram.types import Message, CallbackQuery, InlineKeyboardButton, InlineKeyboardMarkup
 from aiogram.filters import Command
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
+from aiogram.exceptions import TelegramBadRequest
 
-from database import set_city, set_notify_times, get_user_settings
-from weather_api import get_current_weather, get_forecast_5days
-from scheduler import scheduler, send_daily_weather
+from config import (
+    CITY_LOOKUP_CONCURRENCY, CITY_LOOKUP_TIMEOUT, PROGRESSIVE_CITIES_THRESHOLD, PROGRESSIVE_EDIT_INTERVAL,
+)
 
+from database import set_cities_async, set_notify_times_async, get_user_cities_async, set_user_blocked_async
+from weather_api import get_current_weather, get_forecast_5days, city_resolver
+from scheduler import set_user_slots
+from sender import delivery_queue
+from utils import normalize_city, split_csv, time_to_minute
+
+logger = logging.getLogger(__name__)
 router = Router()
 
 # Стани FSM
@@ -39,6 +50,9 @@ def weather_menu_keyboard() -> InlineKeyboardMarkup:
 @router.message(Command("start"))
 async def cmd_start(message: Message, state: FSMContext):
     await state.clear()
+    # Після розблокування бота Telegram надсилає /start — знову дозволяємо сповіщення
+    await set_user_blocked_async(message.from_user.id, False)
+    delivery_queue.unblock(message.from_user.id)
     welcome_text = (
         "👋 *Вітаю!*\n\n"
         "Я — ваш погодний бот, який допоможе дізнатися поточну погоду 🌤 "
@@ -67,52 +81,92 @@ async def callback_menu_set_notify(call: CallbackQuery, state: FSMContext):
     await call.message.edit_text("Вкажіть часи у форматі HH:MM через кому (24-годинний). Приклад: 15:00, 18:00")
     await state.set_state(NotifyTimeState.waiting_for_times)
 
-@router.callback_query(F.data == "weather_current")
-async def callback_weather_current(call: CallbackQuery):
-    user_id = call.from_user.id
-    city, _ = get_user_settings(user_id)
-    if not city:
+# Паралельні запити для кількох міст
+async def lookup_cities(fetch, cities: list, on_progress=None) -> list:
+    """Запитує погоду для всіх міст [(city_key, name), ...] паралельно (з лімітом і таймаутом на місто), зберігаючи порядок."""
+    semaphore = asyncio.Semaphore(CITY_LOOKUP_CONCURRENCY)
+    results = [None] * len(cities)
+
+    async def lookup(index: int, key: str, city: str):
+        async with semaphore:
+            try:
+                results[index] = await asyncio.wait_for(fetch(city, city_key=key), timeout=CITY_LOOKUP_TIMEOUT)
+            except asyncio.TimeoutError:
+                results[index] = f"⚠️ *{city.title()}*: сервіс погоди не відповів вчасно."
+            except Exception as e:
+                results[index] = f"⚠️ *{city.title()}*: не вдалося отримати дані ({e})."
+        if on_progress is not None:
+            await on_progress(results)
+
+    await asyncio.gather(*(lookup(i, key, city) for i, (key, city) in enumerate(cities)))
+    return results
+
+async def show_cities_weather(call: CallbackQuery, fetch):
+    """Показує погоду для збережених міст; для довгих списків оновлює повідомлення в міру надходження."""
+    cities = await get_user_cities_async(call.from_user.id)
+    if not cities:
         await call.message.edit_text("Спочатку потрібно встановити місто!", reply_markup=main_menu_keyboard())
         return
-    # Розбиваємо на кілька міст, якщо введено через кому
-    cities = [c.strip() for c in city.split(",") if c.strip()]
-    weather_texts = []
-    for c in cities:
-        if c:  # Перевіряємо, чи місто не порожнє
-            weather_text = await get_current_weather(c)
-            weather_texts.append(weather_text)
-    if weather_texts:
-        await call.message.edit_text("\n\n".join(weather_texts), parse_mode="Markdown", reply_markup=weather_menu_keyboard())
-    else:
-        await call.message.edit_text("Немає даних про погоду. Перевірте назви міст!", reply_markup=weather_menu_keyboard())
+
+    on_progress = None
+    if len(cities) >= PROGRESSIVE_CITIES_THRESHOLD:
+        edit_lock = asyncio.Lock()
+        last_edit = [0.0]
+
+        async def on_progress(results):
+            # Не частіше одного редагування за інтервал, щоб не впертися в ліміти Telegram
+            if edit_lock.locked() or time.monotonic() - last_edit[0] < PROGRESSIVE_EDIT_INTERVAL:
+                return
+            async with edit_lock:
+                last_edit[0] = time.monotonic()
+                partial = [text or f"⏳ *{name.title()}*: завантаження..." for (_, name), text in zip(cities, results)]
+                try:
+                    await call.message.edit_text("\n\n".join(partial), parse_mode="Markdown")
+                except TelegramBadRequest:
+                    pass
+
+        await call.message.edit_text(f"⏳ Завантажую погоду для {len(cities)} міст...")
+
+    texts = await lookup_cities(fetch, cities, on_progress)
+    await call.message.edit_text("\n\n".join(texts), parse_mode="Markdown", reply_markup=weather_menu_keyboard())
+
+@router.callback_query(F.data == "weather_current")
+async def callback_weather_current(call: CallbackQuery):
+    await show_cities_weather(call, get_current_weather)
 
 @router.callback_query(F.data == "weather_5days")
 async def callback_weather_5days(call: CallbackQuery):
-    user_id = call.from_user.id
-    city, _ = get_user_settings(user_id)
-    if not city:
-        await call.message.edit_text("Спочатку потрібно встановити місто!", reply_markup=main_menu_keyboard())
-        return
-    # Розбиваємо на кілька міст, якщо введено через кому
-    cities = [c.strip() for c in city.split(",") if c.strip()]
-    forecast_texts = []
-    for c in cities:
-        if c:  # Перевіряємо, чи місто не порожнє
-            forecast_text = await get_forecast_5days(c)
-            forecast_texts.append(forecast_text)
-    if forecast_texts:
-        await call.message.edit_text("\n\n".join(forecast_texts), parse_mode="Markdown", reply_markup=weather_menu_keyboard())
-    else:
-        await call.message.edit_text("Немає даних про прогноз. Перевірте назви міст!", reply_markup=weather_menu_keyboard())
+    await show_cities_weather(call, get_forecast_5days)
 
 @router.message(CityState.waiting_for_city)
 async def city_input(message: Message, state: FSMContext):
-    cities = [c.strip() for c in message.text.split(",") if c.strip()]
+    cities = split_csv(message.text)
     if not cities:
         await message.answer("Введіть принаймні одне місто (наприклад: Київ, Охтирка, Ужгород).", reply_markup=main_menu_keyboard())
         return
-    set_city(message.from_user.id, ", ".join(cities))  # Зберігаємо як список через кому з пробілом
-    await message.answer(f"Міста *{', '.join(cities)}* збережено! Тепер можна дізнатися погоду.", reply_markup=main_menu_keyboard())
+    # Геокодуємо назви один раз тут, щоб далі запитувати погоду за координатами
+    resolved, not_found = [], []
+    for name in cities:
+        try:
+            city = await city_resolver.resolve(name)
+        except Exception as e:
+            # Геокодер недоступний — зберігаємо назву як є, погода шукатиметься за назвою
+            logger.warning(f"Не вдалося геокодувати {name!r}: {e}")
+            resolved.append((normalize_city(name), name))
+            continue
+        if city is None:
+            not_found.append(name)
+        elif all(key != city.key for key, _ in resolved):  # «Київ» і «Kyiv» — одне місто
+            resolved.append((city.key, city.name))
+    if not resolved:
+        await message.answer(f"Не вдалося знайти міста: *{', '.join(not_found)}*. Перевірте назви та спробуйте ще раз.")
+        return
+    await set_cities_async(message.from_user.id, resolved)
+    saved = ", ".join(name for _, name in resolved)
+    text = f"Міста *{saved}* збережено! Тепер можна дізнатися погоду."
+    if not_found:
+        text += f"\nНе знайдено: *{', '.join(not_found)}*."
+    await message.answer(text, reply_markup=main_menu_keyboard())
     await state.clear()
 
 @router.message(NotifyTimeState.waiting_for_times)
@@ -124,25 +178,7 @@ async def notify_time_input(message: Message, state: FSMContext):
         if not re.match(pattern, time_str):
             await message.answer("Невірний формат часу. Кожен час має бути у форматі HH:MM (приклад: 15:00, 18:00).")
             return
-    set_notify_times(message.from_user.id, times_str)
-    user_id = message.from_user.id
-    job_id_base = f"user_{user_id}"
-    # Видаляємо всі старі завдання для цього користувача
-    for job_id in scheduler.get_jobs():
-        if job_id.id.startswith(job_id_base):
-            scheduler.remove_job(job_id.id)
-    # Додаємо нові завдання
-    for time_str in times:
-        hour, minute = time_str.split(":")
-        job_id = f"{job_id_base}_{time_str.replace(':', '_')}"
-        scheduler.add_job(
-            send_daily_weather,
-            trigger='cron',
-            hour=int(hour),
-            minute=int(minute),
-            args=[message.bot, user_id],
-            id=job_id,
-            replace_existing=True
-        )
+    await set_notify_times_async(message.from_user.id, times)
+    set_user_slots(message.from_user.id, [time_to_minute(t) for t in times])
     await message.answer(f"Сповіщення встановлено на {times_str} щодня!", reply_markup=main_menu_keyboard())
     await state.clear()
\ No newline at end of file
@@ -0,0 +1,141 @@
+import asyncio
+import logging
+import time
+from collections import deque
+from aiogram import Bot, Dispatcher
+from aiogram.types import Update
+from config import UPDATE_WORKERS, UPDATE_QUEUE_SIZE, UPDATE_DEDUP_SIZE
+from metrics import update_seconds
+
+logger = logging.getLogger(__name__)
+
+QUEUED = "queued"
+DUPLICATE = "duplicate"
+FULL = "full"
+
+
+class UpdateQueue:
+    """Обмежена черга вхідних оновлень і пул воркерів диспетчера.
+
+    Webhook лише кладе оновлення в чергу й одразу відповідає Telegram, тож
+    повільний запит до OpenWeather не тримає HTTP-відповідь відкритою.
+    Черга розбита на шарди за чатом, і кожен шард обробляє один воркер:
+    оновлення одного чату йдуть по черзі, тож стан FSM встигає змінитися
+    до наступного повідомлення користувача.
+    Повтори з тим самим update_id відкидаються, а при заповненій черзі
+    webhook повертає 503, щоб Telegram повторив доставку пізніше.
+    """
+
+    def __init__(self, workers: int = UPDATE_WORKERS, maxsize: int = UPDATE_QUEUE_SIZE,
+                 dedup_size: int = UPDATE_DEDUP_SIZE):
+        self.workers = workers
+        self.maxsize = maxsize
+        # Місткість кожного шарду; разом вони вміщують приблизно maxsize оновлень
+        self.shard_size = max(1, -(-maxsize // workers))
+        self._queues = None
+        self._tasks = []
+        self._dp = None
+        self._bot = None
+        self._seen_ids = set()
+        self._seen_order = deque(maxlen=dedup_size)
+        self.processed = 0
+        self.failed = 0
+        self.duplicates = 0
+        self.rejected = 0
+        self.last_lag = 0.0
+        self.max_lag = 0.0
+
+    def start(self, dp: Dispatcher, bot: Bot):
+        """Запускає воркерів; викликається з on_startup."""
+        if self._tasks:
+            return
+        self._dp = dp
+        self._bot = bot
+        self._ensure_queues()
+        self._tasks = [asyncio.create_task(self._worker(queue)) for queue in self._queues]
+
+    async def stop(self, drain_timeout: float = 5.0):
+        """Дообробляє чергу (не довше drain_timeout) і зупиняє воркерів."""
+        if self._queues is not None and self._tasks:
+            try:
+                await asyncio.wait_for(
+                    asyncio.gather(*(queue.join() for queue in self._queues)), timeout=drain_timeout,
+                )
+            except asyncio.TimeoutError:
+                logger.warning(f"Черга оновлень не спорожніла, залишилось {self._depth()}")
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def _ensure_queues(self):
+        if self._queues is None:
+            self._queues = [asyncio.Queue(maxsize=self.shard_size) for _ in range(self.workers)]
+
+    def _depth(self) -> int:
+        return sum(queue.qsize() for queue in self._queues) if self._queues is not None else 0
+
+    @staticmethod
+    def _shard_key(update: Update) -> int:
+        """Чат (або користувач), до якого належить оновлення; інакше сам update_id."""
+        try:
+            event = update.event
+        except Exception:
+            return update.update_id
+        chat = getattr(event, "chat", None) or getattr(getattr(event, "message", None), "chat", None)
+        if chat is not None:
+            return chat.id
+        user = getattr(event, "from_user", None) or getattr(event, "user", None)
+        return user.id if user is not None else update.update_id
+
+    def submit(self, update: Update) -> str:
+        """Ставить оновлення в шард його чату без очікування; повертає QUEUED, DUPLICATE або FULL."""
+        if update.update_id in self._seen_ids:
+            self.duplicates += 1
+            return DUPLICATE
+        self._ensure_queues()
+        queue = self._queues[hash(self._shard_key(update)) % len(self._queues)]
+        try:
+            queue.put_nowait((update, time.monotonic()))
+        except asyncio.QueueFull:
+            self.rejected += 1
+            return FULL
+        if len(self._seen_order) == self._seen_order.maxlen:
+            self._seen_ids.discard(self._seen_order[0])
+        self._seen_order.append(update.update_id)
+        self._seen_ids.add(update.update_id)
+        return QUEUED
+
+    async def _worker(self, queue: asyncio.Queue):
+        while True:
+            update, enqueued_at = await queue.get()
+            self.last_lag = time.monotonic() - enqueued_at
+            self.max_lag = max(self.max_lag, self.last_lag)
+            started = time.perf_counter()
+            try:
+                await self._dp.feed_update(bot=self._bot, update=update)
+                self.processed += 1
+                update_seconds.observe(time.perf_counter() - started, "ok")
+            except Exception as e:
+                self.failed += 1
+                update_seconds.observe(time.perf_counter() - started, "error")
+                logger.error(f"Помилка обробки оновлення {update.update_id}: {e}", exc_info=True)
+            finally:
+                queue.task_done()
+
+    def stats(self) -> dict:
+        return {
+            "queue_depth": self._depth(),
+            "queue_size": self.maxsize,
+            "workers": len(self._tasks),
+            "processed": self.processed,
+            "failed": self.failed,
+            "duplicates": self.duplicates,
+            "rejected": self.rejected,
+            "last_lag_sec": round(self.last_lag, 4),
+            "max_lag_sec": round(self.max_lag, 4),
+        }
+
+
+# Спільна черга; воркерів запускає/зупиняє main.py
+update_queue = UpdateQueue()
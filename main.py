@@ -1,25 +1,130 @@
 import logging
 import asyncio
+import random
+import time
 from aiogram import Bot, Dispatcher
 from aiogram.client.default import DefaultBotProperties
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
 from aiogram.fsm.storage.memory import MemoryStorage
 from aiogram.types import Update
+from pydantic import ValidationError
 import aiohttp.web
 
-from database import init_db
-from config import BOT_TOKEN, WEBHOOK_URL
+from database import init_db, close_db
+from config import BOT_TOKEN, WEBHOOK_URL, WEBHOOK_LOG_SAMPLE_RATE, TELEGRAM_API_URL, IN_MEMORY_SUBSCRIPTIONS
 from handlers import router
-from scheduler import schedule_jobs, start_scheduler
+from scheduler import (
+    get_dispatch_stats, get_prefetch_stats, schedule_jobs, start_scheduler, hydrate_subscriptions, get_hydration_status, resume_pending, release_own_leases,
+)
+from sender import delivery_queue
+from ingest import update_queue, FULL
+from weather_api import weather_client, city_resolver, get_upstream_stats, get_cache_stats
+from geocoding import backfill_city_keys, backfill_stats
+from metrics import registry, webhook_seconds, CONTENT_TYPE
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-bot = Bot(token=BOT_TOKEN, default=DefaultBotProperties(parse_mode="Markdown"))
+session = AiohttpSession(api=TelegramAPIServer.from_base(TELEGRAM_API_URL)) if TELEGRAM_API_URL else None
+bot = Bot(token=BOT_TOKEN, session=session, default=DefaultBotProperties(parse_mode="Markdown"))
 dp = Dispatcher(storage=MemoryStorage())
 dp.include_router(router)
 logger.info("Dispatcher and router initialized")
 
 init_db()
+background_tasks = set()
+
+
+def _background_task_done(task: asyncio.Task):
+    background_tasks.discard(task)
+    if not task.cancelled() and task.exception() is not None:
+        logger.error(f"Фонова задача {task.get_name()} завершилася з помилкою", exc_info=task.exception())
+
+
+# Лічильники з наявних stats()-словників читаються під час запиту /metrics
+@registry.collector("weatherbot_cache_hits_total", "Відповіді з кешу без запиту до OpenWeather", "counter", ("cache",))
+def _cache_hits():
+    return [((name,), stats["hits"] + stats.get("stale_hits", 0)) for name, stats in get_cache_stats().items()]
+
+
+@registry.collector("weatherbot_cache_misses_total", "Промахи кешу", "counter", ("cache",))
+def _cache_misses():
+    return [((name,), stats["misses"]) for name, stats in get_cache_stats().items()]
+
+
+@registry.collector("weatherbot_cache_coalesced_total", "Запити, що приєдналися до вже активного завантаження того самого ключа", "counter", ("cache",))
+def _cache_coalesced():
+    return [((name,), stats["coalesced"]) for name, stats in get_cache_stats().items() if "coalesced" in stats]
+
+
+@registry.collector("weatherbot_cache_stale_on_error_total", "Застарілі дані, віддані через збій OpenWeather", "counter", ("cache",))
+def _cache_stale_on_error():
+    return [((name,), stats["stale_on_error"]) for name, stats in get_cache_stats().items() if "stale_on_error" in stats]
+
+
+@registry.collector("weatherbot_cache_refresh_errors_total", "Невдалі фонові оновлення кешу (refresh-ahead, stale-while-revalidate)", "counter", ("cache",))
+def _cache_refresh_errors():
+    return [((name,), stats["background_errors"]) for name, stats in get_cache_stats().items() if "background_errors" in stats]
+
+
+@registry.collector("weatherbot_prefetch_slots_total", "Слоти, для яких прогрівався кеш погоди", "counter")
+def _prefetch_slots():
+    return [((), get_prefetch_stats()["slots"])]
+
+
+@registry.collector("weatherbot_prefetch_cities_total", "Міста в прогріві кешу перед слотом за результатом", "counter", ("result",))
+def _prefetch_cities():
+    stats = get_prefetch_stats()
+    skipped = stats["cities_total"] - stats["warmed_total"] - stats["errors_total"]
+    return [(("warmed",), stats["warmed_total"]), (("fresh",), skipped), (("error",), stats["errors_total"])]
+
+
+@registry.collector("weatherbot_openweather_retries_total", "Повторні спроби запитів до OpenWeather", "counter")
+def _upstream_retries():
+    return [((), get_upstream_stats()["retries"])]
+
+
+@registry.collector("weatherbot_circuit_open", "1, якщо запобіжник OpenWeather розімкнено", "gauge")
+def _circuit_open():
+    return [((), int(get_upstream_stats()["breaker"]["state"] != "closed"))]
+
+
+@registry.collector("weatherbot_queue_depth", "Глибина черг вхідних оновлень і вихідних повідомлень", "gauge", ("queue",))
+def _queue_depth():
+    return [(("updates",), update_queue.stats()["queue_depth"]), (("sends",), delivery_queue.stats()["queue_depth"])]
+
+
+@registry.collector("weatherbot_messages_total", "Результати доставки повідомлень (кожне повідомлення враховується один раз)", "counter", ("result",))
+def _messages():
+    stats = delivery_queue.stats()
+    return [(("sent",), stats["sent"]), (("dropped",), stats["dropped"])]
+
+
+@registry.collector("weatherbot_telegram_retries_total", "Повторні спроби sendMessage (RetryAfter, мережеві збої)", "counter")
+def _telegram_retries():
+    return [((), delivery_queue.stats()["retried"])]
+
+
+@registry.collector("weatherbot_send_rate_per_second", "Швидкість надсилання за останню хвилину", "gauge")
+def _send_rate():
+    return [((), delivery_queue.stats()["send_rate_per_sec"])]
+
+
+@registry.collector("weatherbot_notification_slots_total", "Розіслані слоти сповіщень", "counter")
+def _slots():
+    return [((), get_dispatch_stats()["ticks"])]
+
+
+@registry.collector("weatherbot_upstream_calls_saved_total", "Запити до OpenWeather, заощаджені групуванням слоту за містом", "counter")
+def _upstream_calls_saved():
+    return [((), get_dispatch_stats()["upstream_calls_saved_total"])]
+
+
+@registry.collector("weatherbot_last_slot", "Підсумок останнього розісланого слоту", "gauge", ("field",))
+def _last_slot():
+    stats = get_dispatch_stats()
+    return [((field,), stats["last_" + field]) for field in ("recipients", "cities", "upstream_calls_saved")]
 
 async def on_startup(app):
     logger.info("Бот запускається...")
@@ -28,47 +133,107 @@ async def on_startup(app):
     if webhook_info.url != WEBHOOK_URL:
         logger.info(f"Встановлюю новий webhook: {WEBHOOK_URL}")
         await bot.set_webhook(url=WEBHOOK_URL)
+    await weather_client.start()
+    await city_resolver.load()
+    update_queue.start(dp, bot)
+    delivery_queue.start(bot)
     start_scheduler()
-    await schedule_jobs(bot)
+    schedule_jobs()
+    # Досилаємо невідправлене, якщо процес перезапустився посеред розсилки, і догеокодовуємо
+    # міста, які ще збережені за назвою. Індекс підписок у пам'яті (лише для одного екземпляра)
+    # завантажується у фоні; до завершення тік читає слоти напряму з бази
+    await release_own_leases()
+    tasks = [("resume_pending", resume_pending()), ("backfill_city_keys", backfill_city_keys(city_resolver))]
+    if IN_MEMORY_SUBSCRIPTIONS:
+        tasks.append(("hydrate_subscriptions", hydrate_subscriptions()))
+    for name, coro in tasks:
+        task = asyncio.create_task(coro, name=name)
+        background_tasks.add(task)
+        task.add_done_callback(_background_task_done)
     logger.info("Webhook встановлено. Планувальник запущено.")
 
 async def on_shutdown(app):
     logger.info("Бот зупиняється...")
+    for task in background_tasks:
+        task.cancel()
     await bot.delete_webhook()
+    await update_queue.stop()
     await dp.storage.close()
+    await delivery_queue.stop()
+    await release_own_leases()
+    await weather_client.close()
+    close_db()
     await bot.session.close()
 
-async def start_webhook():
+def create_app() -> aiohttp.web.Application:
     app = aiohttp.web.Application()
 
     async def handle_root(request):
         return aiohttp.web.Response(text="Бот працює")
 
+    async def handle_health(request):
+        status = get_hydration_status()
+        if status["ready"]:
+            state = "ready"
+        else:
+            # Завантаження індексу повторюється після помилки бази — видно в пробі готовності
+            state = "hydration_failing" if status["last_error"] else "starting"
+        return aiohttp.web.json_response(
+            {"status": state, "hydration": status, "updates": update_queue.stats(),
+             "upstream": get_upstream_stats(), "prefetch": get_prefetch_stats(),
+             "city_backfill": dict(backfill_stats)},
+            status=200 if status["ready"] else 503,
+        )
+
+    async def handle_metrics(request):
+        return aiohttp.web.Response(body=registry.render().encode(), headers={"Content-Type": CONTENT_TYPE})
+
     async def handle_webhook(request):
-        if request.method == "POST":
-            try:
-                logger.info("Отримано запит до webhook")
-                data = await request.json()
-                logger.info(f"Дані webhook: {data}")
-                if not isinstance(data, dict) or 'update_id' not in data:
-                    logger.error("Невірний формат даних webhook")
-                    return aiohttp.web.Response(status=400)
-                update = Update(**data)
-                logger.info("Передача оновлення до диспетчера")
-                await dp.feed_update(bot=bot, update=update)
-                logger.info("Оновлення оброблено успішно")
-                return aiohttp.web.Response(text="OK")
-            except Exception as e:
-                logger.error(f"Помилка обробки webhook: {e}", exc_info=True)
-                return aiohttp.web.Response(status=500)
-        return aiohttp.web.Response(status=404)
+        started = time.perf_counter()
+        body = await request.read()
+        if WEBHOOK_LOG_SAMPLE_RATE and random.random() < WEBHOOK_LOG_SAMPLE_RATE:
+            logger.info("Дані webhook (вибірка): %s", body)
+        else:
+            logger.debug("Дані webhook: %s", body)
+        try:
+            # Розбір і валідація напряму з байтів (pydantic-core) з прив'язкою до бота,
+            # щоб диспетчер не перестворював Update повторно
+            update = Update.model_validate_json(body, context={"bot": bot})
+        except ValidationError:
+            logger.warning("webhook status=400 bytes=%d", len(body))
+            webhook_seconds.observe(time.perf_counter() - started, "invalid")
+            return aiohttp.web.Response(status=400)
+        try:
+            # Обробка відбувається у воркерах черги, Telegram отримує відповідь одразу
+            result = update_queue.submit(update)
+        except Exception as e:
+            logger.error(f"Помилка обробки webhook: {e}", exc_info=True)
+            webhook_seconds.observe(time.perf_counter() - started, "error")
+            return aiohttp.web.Response(status=500)
+        status = 503 if result == FULL else 200
+        elapsed = time.perf_counter() - started
+        webhook_seconds.observe(elapsed, result)
+        logger.info(
+            "webhook update_id=%d status=%d result=%s bytes=%d ms=%.2f",
+            update.update_id, status, result, len(body), elapsed * 1000,
+        )
+        if result == FULL:
+            return aiohttp.web.Response(status=503, headers={"Retry-After": "1"})
+        return aiohttp.web.Response(text="OK")
 
     app.router.add_get("/", handle_root)
+    app.router.add_get("/health", handle_health)
+    app.router.add_get("/metrics", handle_metrics)
     app.router.add_post("/webhook", handle_webhook)
     app.on_startup.append(on_startup)
     app.on_shutdown.append(on_shutdown)
+    return app
+
+async def start_webhook():
+    app = create_app()
 
-    runner = aiohttp.web.AppRunner(app)
+    # Власний однорядковий лог webhook замість access-логу aiohttp на кожен запит
+    runner = aiohttp.web.AppRunner(app, access_log=None)
     await runner.setup()
     site = aiohttp.web.TCPSite(runner, host="0.0.0.0", port=10000)
     await site.start()
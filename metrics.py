@@ -0,0 +1,158 @@
+import bisect
+import time
+from contextlib import contextmanager
+
+# Межі кошиків гістограм затримки, секунди
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _format_labels(names, values) -> str:
+    if not names:
+        return ""
+    pairs = ",".join(
+        '%s="%s"' % (name, str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+        for name, value in zip(names, values)
+    )
+    return "{" + pairs + "}"
+
+
+def _format_value(value) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if isinstance(value, float) and not value.is_integer():
+        return repr(value)
+    return str(int(value))
+
+
+class Counter:
+    """Лічильник, що лише зростає; значення окремо для кожного набору міток."""
+
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+
+    def inc(self, amount: float = 1, *labels):
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+    def collect(self):
+        for labels, value in self._values.items():
+            yield self.name, _format_labels(self.labelnames, labels), value
+
+
+class Histogram:
+    """Гістограма у форматі Prometheus: кумулятивні кошики, сума та кількість спостережень."""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # мітки -> [лічильники кошиків (+Inf останній), сума]
+        self._series = {}
+
+    def observe(self, value: float, *labels):
+        series = self._series.get(labels)
+        if series is None:
+            series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+        series[0][bisect.bisect_left(self.buckets, value)] += 1
+        series[1] += value
+
+    @contextmanager
+    def time(self, *labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, *labels)
+
+    def collect(self):
+        names = self.labelnames + ("le",)
+        for labels, (counts, total) in self._series.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                yield self.name + "_bucket", _format_labels(names, labels + (_format_value(bound),)), cumulative
+            yield self.name + "_sum", _format_labels(self.labelnames, labels), total
+            yield self.name + "_count", _format_labels(self.labelnames, labels), cumulative
+
+
+class StatsCollector:
+    """Метрики, що читаються з наявних stats()-словників у момент запиту /metrics.
+
+    callback повертає список (мітки, значення) у порядку labelnames.
+    """
+
+    def __init__(self, name: str, documentation: str, kind: str, callback, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.kind = kind
+        self.labelnames = tuple(labelnames)
+        self._callback = callback
+
+    def collect(self):
+        for labels, value in self._callback():
+            yield self.name, _format_labels(self.labelnames, labels), value
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = {}
+
+    def register(self, metric):
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames=()) -> Counter:
+        return self.register(Counter(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames=(), buckets=LATENCY_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def collector(self, name: str, documentation: str, kind: str, labelnames=()):
+        """Декоратор: реєструє функцію як джерело значень метрики."""
+        def decorator(callback):
+            self.register(StatsCollector(name, documentation, kind, callback, labelnames))
+            return callback
+        return decorator
+
+    def render(self) -> str:
+        """Текстовий формат експозиції Prometheus 0.0.4."""
+        lines = []
+        for metric in self._metrics.values():
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for name, labels, value in metric.collect():
+                lines.append(f"{name}{labels} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Спільний реєстр; /metrics у main.py віддає registry.render()
+registry = Registry()
+
+webhook_seconds = registry.histogram(
+    "weatherbot_webhook_seconds", "Час обробки запиту /webhook до відповіді Telegram", ("result",),
+)
+update_seconds = registry.histogram(
+    "weatherbot_update_handle_seconds", "Час обробки оновлення диспетчером у воркері черги", ("result",),
+)
+openweather_seconds = registry.histogram(
+    "weatherbot_openweather_request_seconds", "Тривалість однієї спроби запиту до OpenWeather", ("endpoint", "status"),
+)
+telegram_send_seconds = registry.histogram(
+    "weatherbot_telegram_send_seconds", "Тривалість виклику sendMessage", ("result",),
+)
+scheduler_lag_seconds = registry.histogram(
+    "weatherbot_scheduler_lag_seconds", "Запізнення розсилки слоту відносно його хвилини",
+    buckets=(0.1, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0),
+)
+jobs_total = registry.counter(
+    "weatherbot_scheduler_jobs_total", "Запуски задач планувальника за результатом", ("job", "result"),
+)
@@ -0,0 +1,143 @@
+from array import array
+from datetime import date
+from typing import NamedTuple
+
+_EPOCH = date(1970, 1, 1)
+_EPOCH_ORDINAL = _EPOCH.toordinal()
+# Групи кодів OpenWeather з опадами: гроза, мряка, дощ
+_RAIN_GROUPS = frozenset((2, 3, 5))
+
+
+class City(NamedTuple):
+    """Геокодоване місто: канонічний ключ, назва та координати."""
+    key: str
+    name: str
+    lat: float
+    lon: float
+    country: str
+
+
+class CurrentWeather(NamedTuple):
+    """Розібрана відповідь /weather."""
+    code: int
+    description: str
+    temp: float
+    feels_like: float
+    humidity: int
+    wind_speed: float
+
+
+class ForecastDay(NamedTuple):
+    """Підсумок одного дня прогнозу (за місцевим часом міста)."""
+    date: str  # YYYY-MM-DD
+    code: int  # стан погоди в записі, найближчому до полудня
+    description: str
+    temp: float  # температура близько полудня
+    temp_min: float
+    temp_max: float
+    temp_mean: float
+    humidity: int
+    wind_speed: float
+    rain_entries: int  # кількість 3-годинних записів з опадами
+
+
+def parse_current(data: dict) -> CurrentWeather:
+    weather = data["weather"][0]
+    main = data["main"]
+    return CurrentWeather(
+        code=weather["id"],
+        description=weather["description"].capitalize(),
+        temp=main["temp"],
+        feels_like=main["feels_like"],
+        humidity=main["humidity"],
+        wind_speed=data["wind"]["speed"],
+    )
+
+
+class Forecast:
+    """Компактний 5-денний прогноз: записи /forecast розкладені по колонках-масивах.
+
+    Займає кілька кілобайт замість дерева словників із відповіді JSON, тому
+    саме ця форма зберігається в кеші.
+    """
+
+    __slots__ = ("tz_offset", "timestamps", "temps", "humidity", "wind", "codes", "description_ids", "descriptions")
+
+    def __init__(self, tz_offset: int = 0):
+        self.tz_offset = tz_offset
+        self.timestamps = array("q")
+        self.temps = array("d")
+        self.humidity = array("B")
+        self.wind = array("d")
+        self.codes = array("H")
+        self.description_ids = array("B")
+        self.descriptions = []
+
+    @classmethod
+    def from_response(cls, data: dict) -> "Forecast":
+        """Один прохід по списку записів відповіді /forecast."""
+        forecast = cls(data.get("city", {}).get("timezone", 0))
+        description_index = {}
+        for entry in data.get("list", []):
+            weather = entry["weather"][0]
+            main = entry["main"]
+            description = weather["description"]
+            description_id = description_index.get(description)
+            if description_id is None:
+                description_id = description_index[description] = len(forecast.descriptions)
+                forecast.descriptions.append(description.capitalize())
+            forecast.timestamps.append(entry["dt"])
+            forecast.temps.append(main["temp"])
+            forecast.humidity.append(main["humidity"])
+            forecast.wind.append(entry["wind"]["speed"])
+            forecast.codes.append(weather["id"])
+            forecast.description_ids.append(description_id)
+        return forecast
+
+    def __len__(self) -> int:
+        return len(self.timestamps)
+
+    def daily(self, limit: int = 5) -> list:
+        """Денні мін/макс/середня температура й кількість записів з опадами за один прохід."""
+        days = []
+        current_day = None
+        for i, timestamp in enumerate(self.timestamps):
+            local = timestamp + self.tz_offset
+            day = local // 86400
+            if day != current_day:
+                if current_day is not None:
+                    days.append(self._summary(current_day, start, i, noon_index, t_min, t_max, t_sum, rain))
+                    if len(days) == limit:
+                        return days
+                current_day = day
+                start = i
+                noon_index, noon_distance = i, 86400
+                t_min = t_max = t_sum = self.temps[i]
+                rain = 0
+            else:
+                temp = self.temps[i]
+                t_min = min(t_min, temp)
+                t_max = max(t_max, temp)
+                t_sum += temp
+            distance = abs(local % 86400 - 43200)
+            if distance < noon_distance:
+                noon_index, noon_distance = i, distance
+            if self.codes[i] // 100 in _RAIN_GROUPS:
+                rain += 1
+        if current_day is not None:
+            days.append(self._summary(current_day, start, len(self.timestamps), noon_index, t_min, t_max, t_sum, rain))
+        return days
+
+    def _summary(self, day, start, end, noon, t_min, t_max, t_sum, rain) -> ForecastDay:
+        return ForecastDay(
+            date=date.fromordinal(_EPOCH_ORDINAL + day).isoformat(),
+            code=self.codes[noon],
+            description=self.descriptions[self.description_ids[noon]],
+            temp=self.temps[noon],
+            temp_min=t_min,
+            temp_max=t_max,
+            temp_mean=t_sum / (end - start),
+            humidity=self.humidity[noon],
+            wind_speed=self.wind[noon],
+            rain_entries=rain,
+        )
@@ -0,0 +1,143 @@
+from collections import OrderedDict
+from models import CurrentWeather
+
+# Шаблони компілюються один раз при імпорті: зберігаємо зв'язаний метод str.format
+_CURRENT = (
+    "🌤 **Погода в місті *{city}* 🌆**:\n\n"
+    "{weather_emoji} • **{w.description}**\n"
+    "🌡️ • **Температура**: {w.temp}°C {temp_emoji}\n"
+    "{feels_emoji} • **Відчувається як**: {w.feels_like}°C\n"
+    "💧 • **Вологість**: {w.humidity}% {humidity_emoji}\n"
+    "💨 • **Вітер**: {w.wind_speed} м/с {wind_emoji}\n"
+    "\n{conclusion}"
+).format
+_CURRENT_HOT = "**Висновок**: Спекотний день у {city}! 🔥 Час для прохолодних напоїв 🥤 і легкого одягу 👕. Не забудь сонцезахисний крем! 🧴".format
+_CURRENT_WARM = "**Висновок**: Тепло і приємно у {city}! 🌞 Ідеально для прогулянки парком 🌳 чи пікніка 🍉.".format
+_CURRENT_MILD = "**Висновок**: Комфортна погода у {city}! 😎 Чудовий день для активного відпочинку 🚴‍♀️ чи затишного чаювання ☕.".format
+_CURRENT_HUMID = " Але вологість висока, тож бери парасольку на всяк випадок! ☂️"
+
+_FORECAST_HEADER = "📅 **Прогноз погоди на 5 днів у *{city}* 🌟**:\n".format
+# Колонки прогнозу зберігаються як float, тож :g друкує цілі значення без ".0", як у відповіді API
+_FORECAST_DAY = (
+    "📍 **{date}** 🗓️\n"
+    "{weather_emoji} • **{d.description}**\n"
+    "🌡️ • **Температура**: {d.temp:g}°C (мін: {d.temp_min:g}°C, макс: {d.temp_max:g}°C) {temp_emoji}\n"
+    "💧 • **Вологість**: {d.humidity}% {humidity_emoji}\n"
+    "💨 • **Вітер**: {d.wind_speed:g} м/с {wind_emoji}\n"
+).format
+_FORECAST_HOT = "**Висновок для {city}**: Спекотний тиждень попереду! 🔥 Чудовий час для пікніків 🍉 і відпочинку на природі 🌳.".format
+_FORECAST_WARM = "**Висновок для {city}**: Теплий і приємний тиждень! 🌞 Ідеально для прогулянок 🚶‍♀️ і активного відпочинку 🚴‍♀️.".format
+_FORECAST_MILD = "**Висновок для {city}**: Комфортна погода на весь тиждень! 😎 Час для затишних вечорів ☕ і легких прогулянок 🌄.".format
+_FORECAST_RAINY = " Але чекай на {rainy_days} дощових днів 🌧️, тож тримай парасольку напоготові! ☂️".format
+_FORECAST_SUNNY = " Сонячна погода гарантована, бери сонцезахисний крем! 🧴"
+
+# Групи кодів погоди OpenWeather (https://openweathermap.org/weather-conditions)
+_GROUP_EMOJI = {2: "⛈️", 3: "🌦️", 5: "🌦️", 6: "❄️", 7: "🌫️"}
+
+
+def weather_emoji(code: int) -> str:
+    """Емодзі за числовим кодом стану погоди (без розбору локалізованого опису)."""
+    if code == 800:
+        return "☀️"
+    if code == 801:
+        return "⛅"
+    if 802 <= code <= 804:
+        return "☁️"
+    return _GROUP_EMOJI.get(code // 100, "⛅")
+
+
+def _temp_emoji(temp: float) -> str:
+    return "🔥" if temp > 28 else "🌞" if temp > 24 else "😎"
+
+
+def _humidity_emoji(humidity: float) -> str:
+    return "🌧️" if humidity > 60 else "💦"
+
+
+def _wind_emoji(wind_speed: float) -> str:
+    return "🌬️" if wind_speed > 5 else "🍃"
+
+
+def render_current(city: str, w: CurrentWeather) -> str:
+    """Текст поточної погоди для міста."""
+    city = city.title()
+    if w.temp > 28:
+        conclusion = _CURRENT_HOT(city=city)
+    elif w.temp > 24:
+        conclusion = _CURRENT_WARM(city=city)
+    else:
+        conclusion = _CURRENT_MILD(city=city)
+    if w.humidity > 60:
+        conclusion += _CURRENT_HUMID
+    return _CURRENT(
+        city=city,
+        w=w,
+        weather_emoji=weather_emoji(w.code),
+        temp_emoji=_temp_emoji(w.temp),
+        feels_emoji="🥵" if w.feels_like > 28 else "😓" if w.feels_like > 24 else "😊",
+        humidity_emoji=_humidity_emoji(w.humidity),
+        wind_emoji=_wind_emoji(w.wind_speed),
+        conclusion=conclusion,
+    )
+
+
+def render_forecast(city: str, days: list) -> str:
+    """Текст прогнозу на кілька днів (список ForecastDay)."""
+    city = city.title()
+    lines = [_FORECAST_HEADER(city=city)]
+    rainy_days = 0
+    for d in days:
+        date = d.date
+        lines.append(_FORECAST_DAY(
+            date=f"{date[8:10]}.{date[5:7]}.{date[:4]}",
+            d=d,
+            weather_emoji=weather_emoji(d.code),
+            temp_emoji=_temp_emoji(d.temp),
+            humidity_emoji=_humidity_emoji(d.humidity),
+            wind_emoji=_wind_emoji(d.wind_speed),
+        ))
+        if d.rain_entries:
+            rainy_days += 1
+
+    avg_temp = sum(d.temp_mean for d in days) / len(days)
+    if avg_temp > 28:
+        conclusion = _FORECAST_HOT(city=city)
+    elif avg_temp > 24:
+        conclusion = _FORECAST_WARM(city=city)
+    else:
+        conclusion = _FORECAST_MILD(city=city)
+    conclusion += _FORECAST_RAINY(rainy_days=rainy_days) if rainy_days else _FORECAST_SUNNY
+    return "\n".join(lines) + "\n" + conclusion
+
+
+class RenderCache:
+    """LRU готових текстів за (вид, місто, версія даних, мова).
+
+    Версія змінюється з кожним новим запитом до OpenWeather, тож поки дані
+    в кеші не оновились, текст не рендериться повторно для кожного отримувача.
+    """
+
+    def __init__(self, maxsize: int = 2048):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get_or_render(self, key: tuple, render):
+        text = self._data.get(key)
+        if text is not None:
+            self._data.move_to_end(key)
+            self.hits += 1
+            return text
+        self.misses += 1
+        text = render()
+        self._data[key] = text
+        if len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+        return text
+
+    def stats(self) -> dict:
+        return {"size": len(self._data), "hits": self.hits, "misses": self.misses}
+
+
+render_cache = RenderCache()
@@ -0,0 +1,97 @@
+import asyncio
+import random
+import time
+
+
+class CircuitOpenError(Exception):
+    """Запит не виконувався: запобіжник розімкнено після серії збоїв."""
+
+
+class UpstreamError(Exception):
+    """Сервіс відповів помилкою, яку варто повторити (5xx, 429)."""
+
+    def __init__(self, status: int):
+        super().__init__(f"HTTP {status}")
+        self.status = status
+
+
+class CircuitBreaker:
+    """Запобіжник: після failure_threshold збоїв поспіль відхиляє запити reset_timeout секунд.
+
+    Потім пропускає один пробний запит (half-open): успіх замикає запобіжник,
+    збій знову розмикає його.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    # Результати admit()
+    REJECTED = "rejected"
+    ADMITTED = "admitted"
+    PROBE = "probe"
+
+    def __init__(self, failure_threshold: int, reset_timeout: float):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._probe_in_flight = False
+        self.opened_total = 0
+        self.rejected = 0
+
+    def admit(self) -> str:
+        """Вирішує, чи пропустити запит: REJECTED, ADMITTED або PROBE (єдиний пробний запит у half-open)."""
+        if self.state == self.OPEN:
+            if time.monotonic() - self.opened_at < self.reset_timeout:
+                self.rejected += 1
+                return self.REJECTED
+            self.state = self.HALF_OPEN
+        if self.state == self.HALF_OPEN:
+            if self._probe_in_flight:
+                self.rejected += 1
+                return self.REJECTED
+            self._probe_in_flight = True
+            return self.PROBE
+        return self.ADMITTED
+
+    def release(self, admission: str):
+        """Звільняє місце пробного запиту, якщо саме цей запит його зайняв і скасований без результату."""
+        if admission == self.PROBE:
+            self._probe_in_flight = False
+
+    def record_success(self):
+        self.state = self.CLOSED
+        self.failures = 0
+        self._probe_in_flight = False
+
+    def record_failure(self):
+        self._probe_in_flight = False
+        self.failures += 1
+        if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+            if self.state != self.OPEN:
+                self.opened_total += 1
+            self.state = self.OPEN
+            self.opened_at = time.monotonic()
+
+    def stats(self) -> dict:
+        return {
+            "state": self.state,
+            "consecutive_failures": self.failures,
+            "opened_total": self.opened_total,
+            "rejected": self.rejected,
+        }
+
+
+def backoff_delay(attempt: int, base: float, cap: float) -> float:
+    """Експоненційна затримка з повним джитером для спроби attempt (з 1)."""
+    return random.uniform(0, min(cap, base * 2 ** (attempt - 1)))
+
+
+async def call_with_deadline(coro_factory, deadline: float):
+    """Виконує coro_factory(), якщо до моменту deadline (time.monotonic) ще є час."""
+    remaining = deadline - time.monotonic()
+    if remaining <= 0:
+        raise asyncio.TimeoutError()
+    return await asyncio.wait_for(coro_factory(), timeout=remaining)
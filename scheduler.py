@@ -1,47 +1,351 @@
+import asyncio
+import logging
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta
+from apscheduler.events import EVENT_JOB_ERROR, EVENT_JOB_EXECUTED, EVENT_JOB_MISSED
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
-from database import get_all_users, get_user_settings
-from weather_api import get_current_weather
-from aiogram import Bot
+from database import (
+    count_notify_times_async, get_notify_times_chunk_async, get_users_cities_async, get_users_due_at_async,
+    create_deliveries_async, claim_deliveries_async, finish_delivery_async, get_pending_slots_async,
+    prune_deliveries_async, release_leases_async, renew_leases_async,
+)
+from config import (
+    IN_MEMORY_SUBSCRIPTIONS, HYDRATION_CHUNK_SIZE, HYDRATION_RETRY_DELAY, HYDRATION_RETRY_MAX_DELAY, PREFETCH_LEAD_MINUTES, PREFETCH_RATE, PREFETCH_MIN_USERS, INSTANCE_ID,
+    DELIVERY_LEASE_SECONDS, DELIVERY_CLAIM_BATCH, DELIVERY_RESUME_MINUTES, DELIVERY_LOG_RETENTION_DAYS,
+)
+from weather_api import get_current_weather, prefetch_current_weather
+from sender import delivery_queue, BLOCKED
+from metrics import jobs_total, scheduler_lag_seconds
 import pytz
 
+logger = logging.getLogger(__name__)
+
 # Ініціалізація планувальника з часовим поясом
 scheduler = AsyncIOScheduler(timezone=pytz.timezone("Europe/Kyiv"))
 
-async def send_daily_weather(bot: Bot, user_id: int):
-    """Надсилає щоденне сповіщення з погодою."""
-    city, _ = get_user_settings(user_id)
-    if not city:
-        return
-    weather_text = await get_current_weather(city)
+TICK_JOB_ID = "notify_tick"
+LEASE_JOB_ID = "renew_leases"
+# Скільки пропущених хвилин надолужує тік, якщо цикл подій був зайнятий
+MAX_CATCHUP_MINUTES = 5
+
+# Індекс підписок: хвилина доби -> user_id, та зворотний user_id -> хвилини доби.
+# Ведеться лише з IN_MEMORY_SUBSCRIPTIONS (один екземпляр); інакше слот читається з бази на кожен тік
+slot_subscribers = defaultdict(set)
+user_slots = {}
+_last_dispatched = None
+_pruned_for = None
+
+# Метрики прогріву кешу перед слотами
+prefetch_stats = {
+    "slots": 0,
+    "last_slot": None,
+    "last_cities": 0,
+    "last_warmed": 0,
+    "last_errors": 0,
+    "cities_total": 0,
+    "warmed_total": 0,
+    "errors_total": 0,
+}
+_prefetch_tasks = set()
+
+# Стан фонового завантаження індексу після старту (для /health); без індексу завантажувати нічого
+hydration = {
+    "enabled": IN_MEMORY_SUBSCRIPTIONS,
+    "ready": not IN_MEMORY_SUBSCRIPTIONS,
+    "loaded": 0,
+    "total": 0,
+    "started_at": None,
+    "duration_sec": None,
+    "failures": 0,
+    "last_error": None,
+}
+# Користувачі, що змінили часи під час завантаження: їхні рядки з бази вже застарілі
+_updated_during_hydration = set()
+
+# Метрики розсилки: скільки запитів до OpenWeather заощадило групування за містом
+dispatch_stats = {
+    "ticks": 0,
+    "last_slot": None,
+    "last_recipients": 0,
+    "last_cities": 0,
+    "last_upstream_calls_saved": 0,
+    "upstream_calls_saved_total": 0,
+    "resumed_total": 0,
+}
+# Доставки (date, slot, user_id), що чекають у черзі надсилання цього екземпляра.
+# Їхню оренду продовжує renew_leases, а повторно взяті з бази вони не розсилаються вдруге
+_in_flight = set()
+
+async def send_daily_weather(day: str, slot: int, user_id: int, weather_text: str):
+    """Ставить щоденне сповіщення в чергу надсилання; результат записується в журнал доставки."""
+    delivery = (day, slot, user_id)
+
+    async def on_done(status: str):
+        try:
+            await finish_delivery_async(day, slot, user_id, INSTANCE_ID, status)
+        finally:
+            _in_flight.discard(delivery)
+
+    _in_flight.add(delivery)
+    if not await delivery_queue.enqueue(user_id, weather_text, on_done=on_done):
+        await on_done(BLOCKED)
+
+async def _city_weather(key: str, name: str) -> str:
+    """Погода одного міста для розсилки: збій одного міста не зриває весь слот."""
     try:
-        await bot.send_message(chat_id=user_id, text=weather_text, parse_mode="Markdown")
-    except Exception:
-        pass
-
-def schedule_jobs(bot: Bot):
-    """Додає завдання для всіх користувачів із встановленим notify_times."""
-    users = get_all_users()
-    for user_id, city, notify_times in users:
-        if notify_times:
-            job_id_base = f"user_{user_id}"
-            # Видаляємо всі старі завдання для цього користувача
-            for job_id in scheduler.get_jobs():
-                if job_id.id.startswith(job_id_base):
-                    scheduler.remove_job(job_id.id)
-            # Додаємо нові завдання для кожного часу
-            times = [t.strip() for t in notify_times.split(",")]
-            for time_str in times:
-                hour, minute = time_str.split(":")
-                job_id = f"{job_id_base}_{time_str.replace(':', '_')}"
-                scheduler.add_job(
-                    send_daily_weather,
-                    trigger='cron',
-                    hour=int(hour),
-                    minute=int(minute),
-                    args=[bot, user_id],
-                    id=job_id,
-                    replace_existing=True
-                )
+        return await get_current_weather(name, city_key=key)
+    except Exception as e:
+        logger.exception(f"Не вдалося підготувати погоду для {name}")
+        return f"⚠️ {name}: не вдалося отримати погоду ({type(e).__name__})"
+
+async def dispatch_slot(day: str, slot: int, user_ids, tally: dict):
+    """Групує підписників слоту за містом: погода кожного міста запитується й рендериться один раз.
+
+    Кожен користувач отримує одне повідомлення з погодою всіх своїх міст.
+    Кількість одержувачів, міст і заощаджених запитів додається в tally.
+    """
+    recipients = {}  # user_id -> ключі міст у порядку користувача
+    city_names = {}  # ключ міста -> назва для запиту
+    for user_id, cities in (await get_users_cities_async(user_ids)).items():
+        for key, name in cities:
+            city_names.setdefault(key, name)
+        recipients[user_id] = [key for key, _ in cities]
+    texts = await asyncio.gather(*(_city_weather(key, name) for key, name in city_names.items()))
+    city_texts = dict(zip(city_names, texts))
+
+    requested = sum(len(keys) for keys in recipients.values())
+    saved = requested - len(city_names)
+    tally["recipients"] += len(recipients)
+    tally["cities"] += len(city_names)
+    tally["upstream_calls_saved"] += saved
+    dispatch_stats["upstream_calls_saved_total"] += saved
+
+    for user_id in user_ids:
+        if user_id not in recipients:
+            await finish_delivery_async(day, slot, user_id, INSTANCE_ID, "skipped")
+    for user_id, keys in recipients.items():
+        await send_daily_weather(day, slot, user_id, "\n\n".join(city_texts[key] for key in keys))
+
+async def deliver_slot(day: str, slot: int) -> dict:
+    """Бере доставки слоту в оренду пачками й розсилає їх.
+
+    Оренда атомарна в SQLite, тож кілька екземплярів ділять слот між собою без дублів.
+    Повертає підсумок: взято доставок, одержувачів, міст і заощаджених запитів.
+    """
+    tally = {"claimed": 0, "recipients": 0, "cities": 0, "upstream_calls_saved": 0}
+    while True:
+        claimed = await claim_deliveries_async(day, slot, INSTANCE_ID, DELIVERY_LEASE_SECONDS, DELIVERY_CLAIM_BATCH)
+        if not claimed:
+            return tally
+        # Оренда могла сплисти, поки доставка чекала в нашій же черзі, — не дублюємо її
+        claimed = [user_id for user_id in claimed if (day, slot, user_id) not in _in_flight]
+        tally["claimed"] += len(claimed)
+        if claimed:
+            await dispatch_slot(day, slot, claimed, tally)
+
+async def resume_pending(now: datetime = None):
+    """Досилає невідправлені доставки останніх слотів (після рестарту чи падіння іншого екземпляра)."""
+    now = now or datetime.now(scheduler.timezone)
+    day = now.date().isoformat()
+    minute_of_day = now.hour * 60 + now.minute
+    for slot in await get_pending_slots_async(day, max(0, minute_of_day - DELIVERY_RESUME_MINUTES), minute_of_day):
+        resumed = (await deliver_slot(day, slot))["claimed"]
+        if resumed:
+            dispatch_stats["resumed_total"] += resumed
+            logger.info(f"Досилаємо {resumed} сповіщень слоту {slot // 60:02d}:{slot % 60:02d}")
+
+async def renew_leases():
+    """Продовжує оренду доставок, що ще чекають у черзі надсилання, щоб їх не взяв інший екземпляр."""
+    if _in_flight:
+        await renew_leases_async(INSTANCE_ID, list(_in_flight), DELIVERY_LEASE_SECONDS)
+
+async def release_own_leases():
+    """Звільняє оренду невідправлених доставок цього екземпляра (при зупинці чи рестарті з тим самим INSTANCE_ID)."""
+    await release_leases_async(INSTANCE_ID)
+
+def get_dispatch_stats() -> dict:
+    return dict(dispatch_stats)
+
+def set_user_slots(user_id: int, minutes):
+    """Замінює хвилини сповіщень користувача в індексі (O(1) на кожну підписку)."""
+    if not IN_MEMORY_SUBSCRIPTIONS:
+        return
+    for slot in user_slots.pop(user_id, ()):
+        bucket = slot_subscribers.get(slot)
+        if bucket is not None:
+            bucket.discard(user_id)
+            if not bucket:
+                del slot_subscribers[slot]
+    if not hydration["ready"]:
+        _updated_during_hydration.add(user_id)
+    new_slots = set(minutes)
+    for slot in new_slots:
+        slot_subscribers[slot].add(user_id)
+    if new_slots:
+        user_slots[user_id] = new_slots
+
+def _due_minutes(now: datetime) -> list:
+    """Хвилини від останнього тіку до now включно (щоб не загубити слот при затримці)."""
+    global _last_dispatched
+    current = now.replace(second=0, microsecond=0)
+    if _last_dispatched is None or current - _last_dispatched > timedelta(minutes=MAX_CATCHUP_MINUTES):
+        minutes = [current]
+    else:
+        minutes = []
+        moment = _last_dispatched + timedelta(minutes=1)
+        while moment <= current:
+            minutes.append(moment)
+            moment += timedelta(minutes=1)
+    if minutes:
+        _last_dispatched = current
+    return minutes
+
+async def _slot_user_ids(minute_of_day: int) -> list:
+    if IN_MEMORY_SUBSCRIPTIONS and hydration["ready"]:
+        return list(slot_subscribers.get(minute_of_day, ()))
+    # Спільна база — єдине джерело підписок для кількох екземплярів (індексований запит за хвилиною)
+    return await get_users_due_at_async(minute_of_day)
+
+async def prefetch_slot(minute_of_day: int, rate: float = PREFETCH_RATE):
+    """Прогріває кеш погоди для всіх міст слоту, рівномірно в межах ліміту rate запитів/с."""
+    user_ids = await _slot_user_ids(minute_of_day)
+    if len(user_ids) < PREFETCH_MIN_USERS:
+        return
+    city_names = {}
+    for cities in (await get_users_cities_async(user_ids)).values():
+        for key, name in cities:
+            city_names.setdefault(key, name)
+    # Дані мають залишатися свіжими до слоту й ще хвилину після нього
+    fresh_for = (PREFETCH_LEAD_MINUTES + 1) * 60
+    tasks = []
+    for i, (key, name) in enumerate(city_names.items()):
+        if i:
+            await asyncio.sleep(1 / rate)
+        tasks.append(asyncio.create_task(prefetch_current_weather(name, fresh_for=fresh_for, city_key=key)))
+    results = await asyncio.gather(*tasks, return_exceptions=True)
+    prefetch_stats["slots"] += 1
+    prefetch_stats["last_slot"] = f"{minute_of_day // 60:02d}:{minute_of_day % 60:02d}"
+    prefetch_stats["last_cities"] = len(city_names)
+    prefetch_stats["last_warmed"] = sum(1 for r in results if r is True)
+    prefetch_stats["last_errors"] = sum(1 for r in results if isinstance(r, BaseException))
+    prefetch_stats["cities_total"] += prefetch_stats["last_cities"]
+    prefetch_stats["warmed_total"] += prefetch_stats["last_warmed"]
+    prefetch_stats["errors_total"] += prefetch_stats["last_errors"]
+
+def _start_prefetch(moment: datetime):
+    target = moment + timedelta(minutes=PREFETCH_LEAD_MINUTES)
+    task = asyncio.create_task(prefetch_slot(target.hour * 60 + target.minute))
+    _prefetch_tasks.add(task)
+    task.add_done_callback(_prefetch_tasks.discard)
+
+def get_prefetch_stats() -> dict:
+    return dict(prefetch_stats)
+
+async def dispatch_tick():
+    """Щохвилинний тік: прогріває кеш для наступних слотів і розсилає сповіщення поточної хвилини."""
+    global _pruned_for
+    now = datetime.now(scheduler.timezone)
+    for moment in _due_minutes(now):
+        if PREFETCH_LEAD_MINUTES > 0:
+            _start_prefetch(moment)
+        day = moment.date().isoformat()
+        slot = moment.hour * 60 + moment.minute
+        user_ids = await _slot_user_ids(slot)
+        if not user_ids:
+            continue
+        # Спершу фіксуємо доставки в журналі (ідемпотентно), потім розсилаємо те, що вдалося взяти в оренду
+        await create_deliveries_async(day, slot, user_ids)
+        scheduler_lag_seconds.observe((datetime.now(scheduler.timezone) - moment).total_seconds())
+        tally = await deliver_slot(day, slot)
+        # last_* описують лише цей тік; досилання (resume_pending) сюди не потрапляє
+        dispatch_stats["ticks"] += 1
+        dispatch_stats["last_slot"] = moment.strftime("%H:%M")
+        dispatch_stats["last_recipients"] = tally["recipients"]
+        dispatch_stats["last_cities"] = tally["cities"]
+        dispatch_stats["last_upstream_calls_saved"] = tally["upstream_calls_saved"]
+        logger.info(
+            f"Слот {moment:%H:%M}: взято {tally['claimed']} з {len(user_ids)} доставок, "
+            f"{tally['cities']} міст, заощаджено {tally['upstream_calls_saved']} запитів"
+        )
+    await resume_pending(now)
+    today = now.date()
+    if _pruned_for != today:
+        await prune_deliveries_async((today - timedelta(days=DELIVERY_LOG_RETENTION_DAYS)).isoformat())
+        _pruned_for = today
+
+async def _hydration_step(what: str, coro_factory):
+    """Виконує крок завантаження індексу, повторюючи його при помилці бази (зі зростаючою затримкою)."""
+    failures = 0
+    while True:
+        try:
+            result = await coro_factory()
+        except Exception as e:
+            failures += 1
+            delay = min(HYDRATION_RETRY_DELAY * 2 ** (failures - 1), HYDRATION_RETRY_MAX_DELAY)
+            hydration["failures"] += 1
+            hydration["last_error"] = f"{type(e).__name__}: {e}"
+            logger.error(f"Індекс підписок: {what} не вдалося ({e}), повтор через {delay:.1f} с")
+            await asyncio.sleep(delay)
+            continue
+        hydration["last_error"] = None
+        return result
+
+async def hydrate_subscriptions(chunk_size: int = HYDRATION_CHUNK_SIZE):
+    """Завантажує індекс підписок пачками у фоні, не блокуючи старт вебхука.
+
+    Помилки бази не зупиняють завантаження: крок повторюється з того ж місця,
+    а остання помилка видна в /health.
+    """
+    started = time.monotonic()
+    hydration["started_at"] = time.time()
+    hydration["total"] = await _hydration_step("підрахунок підписок", count_notify_times_async)
+    after = (-1, -1)
+    while True:
+        rows = await _hydration_step("читання пачки", lambda: get_notify_times_chunk_async(after, chunk_size))
+        if not rows:
+            break
+        for user_id, minute_of_day in rows:
+            if user_id in _updated_during_hydration:
+                continue
+            slot_subscribers[minute_of_day].add(user_id)
+            user_slots.setdefault(user_id, set()).add(minute_of_day)
+        after = rows[-1]
+        hydration["loaded"] += len(rows)
+    hydration["ready"] = True
+    hydration["duration_sec"] = round(time.monotonic() - started, 3)
+    _updated_during_hydration.clear()
+    logger.info(f"Індекс підписок завантажено: {hydration['loaded']} за {hydration['duration_sec']} с")
+
+def get_hydration_status() -> dict:
+    return dict(hydration)
+
+def schedule_jobs():
+    """Реєструє щохвилинний тік і продовження оренди доставок; індекс підписок завантажує hydrate_subscriptions()."""
+    scheduler.add_job(
+        dispatch_tick,
+        trigger='cron',
+        second=0,
+        id=TICK_JOB_ID,
+        replace_existing=True,
+        coalesce=True,
+        misfire_grace_time=30
+    )
+    # Окремою задачею, бо тік може довго чекати на місце в повній черзі надсилання
+    scheduler.add_job(
+        renew_leases,
+        trigger='interval',
+        seconds=max(1, DELIVERY_LEASE_SECONDS / 3),
+        id=LEASE_JOB_ID,
+        replace_existing=True,
+        coalesce=True,
+    )
+
+_JOB_RESULTS = {EVENT_JOB_EXECUTED: "executed", EVENT_JOB_ERROR: "error", EVENT_JOB_MISSED: "missed"}
+
+def _count_job(event):
+    jobs_total.inc(1, event.job_id, _JOB_RESULTS[event.code])
 
 def start_scheduler():
-    scheduler.start()
\ No newline at end of file
+    scheduler.add_listener(_count_job, EVENT_JOB_EXECUTED | EVENT_JOB_ERROR | EVENT_JOB_MISSED)
+    scheduler.start()
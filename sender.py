@@ -0,0 +1,203 @@
+import asyncio
+import logging
+import time
+from collections import deque
+from aiogram import Bot
+from aiogram.exceptions import (
+    TelegramRetryAfter, TelegramForbiddenError, TelegramBadRequest, TelegramNetworkError, TelegramServerError,
+)
+from config import (
+    TELEGRAM_GLOBAL_RATE, TELEGRAM_PER_CHAT_INTERVAL, SEND_WORKERS, SEND_QUEUE_SIZE, SEND_MAX_ATTEMPTS,
+)
+from metrics import telegram_send_seconds
+
+logger = logging.getLogger(__name__)
+
+# Результати доставки, які отримує on_done
+SENT = "sent"
+FAILED = "failed"
+BLOCKED = "blocked"
+
+
+class TokenBucket:
+    """Глобальний ліміт швидкості (токенів за секунду) з можливістю паузи після RetryAfter."""
+
+    def __init__(self, rate: float, capacity: float = None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else rate
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+
+    def pause(self, seconds: float):
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+    async def acquire(self):
+        while True:
+            now = time.monotonic()
+            if now < self._paused_until:
+                await asyncio.sleep(self._paused_until - now)
+                continue
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return
+            await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+class DeliveryQueue:
+    """Асинхронна черга вихідних повідомлень із пулом воркерів.
+
+    Дотримується лімітів Telegram: глобальний токен-бакет (~30 повідомлень/с)
+    та інтервал між повідомленнями в один чат (~1/с). На RetryAfter чекає
+    вказаний час і повторює, заблокованим користувачам більше не надсилає.
+    """
+
+    def __init__(self, workers: int = SEND_WORKERS, maxsize: int = SEND_QUEUE_SIZE,
+                 rate: float = TELEGRAM_GLOBAL_RATE, per_chat_interval: float = TELEGRAM_PER_CHAT_INTERVAL,
+                 max_attempts: int = SEND_MAX_ATTEMPTS):
+        self.workers = workers
+        self.maxsize = maxsize
+        self.per_chat_interval = per_chat_interval
+        self.max_attempts = max_attempts
+        self._bucket = TokenBucket(rate)
+        self._queue = None
+        self._tasks = []
+        self._bot = None
+        self._next_chat_slot = {}  # chat_id -> найраніший момент наступного надсилання
+        self._sent_times = deque()  # моменти надсилання за останню хвилину
+        self.blocked_chats = set()
+        self.sent = 0
+        self.dropped = 0
+        self.retried = 0
+
+    def start(self, bot: Bot):
+        """Запускає воркерів; викликається з on_startup."""
+        if self._tasks:
+            return
+        self._bot = bot
+        if self._queue is None:
+            self._queue = asyncio.Queue(maxsize=self.maxsize)
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self, drain_timeout: float = 5.0):
+        """Дає черзі дочитатися (не довше drain_timeout) і зупиняє воркерів."""
+        if self._queue is not None and self._tasks:
+            try:
+                await asyncio.wait_for(self._queue.join(), timeout=drain_timeout)
+            except asyncio.TimeoutError:
+                logger.warning(f"Черга надсилання не спорожніла, залишилось {self._queue.qsize()} повідомлень")
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def enqueue(self, chat_id: int, text: str, parse_mode: str = "Markdown", on_done=None) -> bool:
+        """Ставить повідомлення в чергу; чекає, якщо черга заповнена. False — чат заблоковано.
+
+        on_done — необов'язкова корутина-функція, яку викличуть з результатом (SENT, FAILED, BLOCKED).
+        """
+        if chat_id in self.blocked_chats:
+            self.dropped += 1
+            return False
+        if self._queue is None:
+            self._queue = asyncio.Queue(maxsize=self.maxsize)
+        await self._queue.put((chat_id, text, parse_mode, on_done))
+        return True
+
+    def unblock(self, chat_id: int):
+        """Знову дозволяє надсилання в чат (користувач розблокував бота)."""
+        self.blocked_chats.discard(chat_id)
+
+    async def join(self):
+        if self._queue is not None:
+            await self._queue.join()
+
+    async def _worker(self):
+        while True:
+            chat_id, text, parse_mode, on_done = await self._queue.get()
+            try:
+                status = await self._deliver(chat_id, text, parse_mode)
+            except Exception as e:
+                self.dropped += 1
+                status = FAILED
+                logger.error(f"Не вдалося надіслати повідомлення в чат {chat_id}: {e}")
+            try:
+                if on_done is not None:
+                    await on_done(status)
+            except Exception as e:
+                logger.error(f"Помилка обробки результату доставки для {chat_id}: {e}")
+            finally:
+                self._queue.task_done()
+
+    async def _wait_chat_slot(self, chat_id: int):
+        now = time.monotonic()
+        slot = max(now, self._next_chat_slot.get(chat_id, 0.0))
+        self._next_chat_slot[chat_id] = slot + self.per_chat_interval
+        if len(self._next_chat_slot) > 10 * self.maxsize:
+            self._next_chat_slot = {k: v for k, v in self._next_chat_slot.items() if v > now}
+        if slot > now:
+            await asyncio.sleep(slot - now)
+
+    async def _deliver(self, chat_id: int, text: str, parse_mode: str) -> str:
+        for attempt in range(1, self.max_attempts + 1):
+            await self._wait_chat_slot(chat_id)
+            await self._bucket.acquire()
+            started = time.perf_counter()
+            try:
+                await self._bot.send_message(chat_id=chat_id, text=text, parse_mode=parse_mode)
+            except TelegramRetryAfter as e:
+                telegram_send_seconds.observe(time.perf_counter() - started, "retry_after")
+                # Flood control стосується всього бота, тож пригальмовуємо всіх воркерів
+                self.retried += 1
+                self._bucket.pause(e.retry_after)
+                await asyncio.sleep(e.retry_after)
+                continue
+            except TelegramForbiddenError:
+                telegram_send_seconds.observe(time.perf_counter() - started, BLOCKED)
+                logger.info(f"Користувач {chat_id} заблокував бота, більше не надсилаємо")
+                self.blocked_chats.add(chat_id)
+                self.dropped += 1
+                return BLOCKED
+            except TelegramBadRequest as e:
+                telegram_send_seconds.observe(time.perf_counter() - started, FAILED)
+                logger.warning(f"Telegram відхилив повідомлення для {chat_id}: {e}")
+                self.dropped += 1
+                return FAILED
+            except (TelegramNetworkError, TelegramServerError) as e:
+                telegram_send_seconds.observe(time.perf_counter() - started, "error")
+                if attempt == self.max_attempts:
+                    raise
+                self.retried += 1
+                await asyncio.sleep(min(2 ** attempt, 30))
+                continue
+            telegram_send_seconds.observe(time.perf_counter() - started, SENT)
+            self.sent += 1
+            now = time.monotonic()
+            self._sent_times.append(now)
+            self._trim_sent_times(now)
+            return SENT
+        self.dropped += 1
+        logger.warning(f"Повідомлення для {chat_id} відкинуто після {self.max_attempts} спроб")
+        return FAILED
+
+    def _trim_sent_times(self, now: float):
+        while self._sent_times and self._sent_times[0] < now - 60:
+            self._sent_times.popleft()
+
+    def stats(self) -> dict:
+        self._trim_sent_times(time.monotonic())
+        return {
+            "queue_depth": self._queue.qsize() if self._queue is not None else 0,
+            "workers": len(self._tasks),
+            "sent": self.sent,
+            "dropped": self.dropped,
+            "retried": self.retried,
+            "blocked_chats": len(self.blocked_chats),
+            "send_rate_per_sec": round(len(self._sent_times) / 60, 2),
+        }
+
+
+# Спільна черга; воркерів запускає/зупиняє main.py
+delivery_queue = DeliveryQueue()
@@ -0,0 +1,28 @@
+import json
+
+try:
+    import orjson
+except ImportError:  # orjson необов'язковий: без нього використовуємо стандартний json
+    orjson = None
+
+def normalize_city(city: str) -> str:
+    """Нормалізує назву міста для ключів кешу: обрізає та стискає пробіли, ігнорує регістр."""
+    return " ".join(city.split()).casefold()
+
+def split_csv(value: str) -> list:
+    """Розбиває рядок, збережений через кому, на непорожні обрізані елементи."""
+    return [item.strip() for item in value.split(",") if item.strip()] if value else []
+
+def time_to_minute(time_str: str) -> int:
+    """Перетворює "HH:MM" на хвилину доби (0..1439)."""
+    hour, minute = time_str.split(":")
+    return int(hour) * 60 + int(minute)
+
+def minute_to_time(minute_of_day: int) -> str:
+    """Перетворює хвилину доби на "HH:MM"."""
+    return f"{minute_of_day // 60:02d}:{minute_of_day % 60:02d}"
+
+
+def json_loads(data):
+    """Швидкий розбір JSON через orjson, якщо він встановлений."""
+    return orjson.loads(data) if orjson is not None else json.loads(data)
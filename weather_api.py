@@ -1,132 +1,400 @@
+import asyncio
+import itertools
+import logging
+import time
 import aiohttp
-from config import OPENWEATHER_API_KEY, OPENWEATHER_BASE_URL
-from collections import defaultdict
-from datetime import datetime
+from config import (
+    OPENWEATHER_API_KEY, OPENWEATHER_BASE_URL, OPENWEATHER_TIMEOUT, OPENWEATHER_CONNECT_TIMEOUT,
+    OPENWEATHER_POOL_LIMIT, OPENWEATHER_POOL_LIMIT_PER_HOST, OPENWEATHER_KEEPALIVE_TIMEOUT, OPENWEATHER_DNS_TTL,
+    CURRENT_WEATHER_CACHE_TTL, FORECAST_CACHE_TTL, WEATHER_CACHE_MAX_SIZE, WEATHER_CACHE_STALE_TTL,
+    WEATHER_CACHE_REFRESH_AHEAD, WEATHER_CACHE_HOT_HITS, WEATHER_CACHE_STALE_IF_ERROR, OPENWEATHER_DEADLINE,
+    OPENWEATHER_MAX_ATTEMPTS, OPENWEATHER_RETRY_BASE_DELAY, OPENWEATHER_RETRY_MAX_DELAY, OPENWEATHER_MAX_CONCURRENCY,
+    CIRCUIT_FAILURE_THRESHOLD, CIRCUIT_RESET_TIMEOUT,
+)
+from collections import OrderedDict
+from geocoding import CityResolver, OpenWeatherGeocoder
+from metrics import openweather_seconds
+from models import Forecast, parse_current
+from rendering import render_current, render_forecast, render_cache
+from resilience import CircuitBreaker, CircuitOpenError, UpstreamError, backoff_delay, call_with_deadline
+from utils import normalize_city, json_loads
 
-async def get_current_weather(city: str, lang: str = "uk") -> str:
-    """Запитує поточну погоду в місті."""
-    url = f"{OPENWEATHER_BASE_URL}/weather"
+logger = logging.getLogger(__name__)
+
+
+class WeatherClient:
+    """Довгоживучий HTTP-клієнт OpenWeather з пулом keep-alive з'єднань.
+
+    Сесія створюється один раз (у on_startup або ліниво під час першого запиту)
+    і закривається в on_shutdown, тож TCP/TLS-з'єднання перевикористовуються
+    між запитами замість нового рукостискання на кожне місто.
+
+    Кожен запит має загальний бюджет часу (deadline) на всі спроби: мережеві
+    збої, таймаути та відповіді 5xx/429 повторюються із затримкою з джитером.
+    Після серії невдалих запитів запобіжник розмикається і запити одразу
+    завершуються CircuitOpenError, а кількість одночасних запитів обмежена.
+    """
+
+    def __init__(self, base_url: str = OPENWEATHER_BASE_URL):
+        self.base_url = base_url.rstrip("/") + "/"
+        self._session = None
+        self.breaker = CircuitBreaker(CIRCUIT_FAILURE_THRESHOLD, CIRCUIT_RESET_TIMEOUT)
+        self._semaphore = asyncio.Semaphore(OPENWEATHER_MAX_CONCURRENCY)
+        self.inflight = 0
+        self.requests = 0
+        self.retries = 0
+        self.timeouts = 0
+        self.failures = 0
+
+    async def start(self):
+        """Створює сесію з обмеженим пулом з'єднань і кешем DNS."""
+        if self._session is not None and not self._session.closed:
+            return
+        connector = aiohttp.TCPConnector(
+            limit=OPENWEATHER_POOL_LIMIT,
+            limit_per_host=OPENWEATHER_POOL_LIMIT_PER_HOST,
+            keepalive_timeout=OPENWEATHER_KEEPALIVE_TIMEOUT,
+            ttl_dns_cache=OPENWEATHER_DNS_TTL,
+            use_dns_cache=True,
+        )
+        timeout = aiohttp.ClientTimeout(total=OPENWEATHER_TIMEOUT, sock_connect=OPENWEATHER_CONNECT_TIMEOUT)
+        self._session = aiohttp.ClientSession(connector=connector, timeout=timeout)
+
+    async def close(self):
+        """Закриває сесію та всі з'єднання пулу."""
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+    async def get_json(self, path: str, params: dict, base_url: str = None, deadline: float = OPENWEATHER_DEADLINE):
+        """Виконує GET-запит до OpenWeather і повертає (status, data)."""
+        admission = self.breaker.admit()
+        if admission == CircuitBreaker.REJECTED:
+            raise CircuitOpenError("OpenWeather тимчасово недоступний")
+        if self._session is None or self._session.closed:
+            await self.start()
+        try:
+            result = await self._get_with_retries((base_url or self.base_url) + path, params, time.monotonic() + deadline)
+        except asyncio.CancelledError:
+            self.breaker.release(admission)
+            raise
+        except Exception:
+            self.failures += 1
+            self.breaker.record_failure()
+            raise
+        self.breaker.record_success()
+        return result
+
+    async def _get_with_retries(self, url: str, params: dict, deadline_at: float):
+        last_error = None
+        for attempt in range(1, OPENWEATHER_MAX_ATTEMPTS + 1):
+            if attempt > 1:
+                delay = backoff_delay(attempt - 1, OPENWEATHER_RETRY_BASE_DELAY, OPENWEATHER_RETRY_MAX_DELAY)
+                if time.monotonic() + delay >= deadline_at:
+                    break
+                self.retries += 1
+                await asyncio.sleep(delay)
+            try:
+                status, data = await call_with_deadline(lambda: self._request(url, params), deadline_at)
+            except asyncio.TimeoutError as e:
+                self.timeouts += 1
+                last_error = e
+                continue
+            except aiohttp.ClientError as e:
+                last_error = e
+                continue
+            if status >= 500 or status == 429:
+                last_error = UpstreamError(status)
+                continue
+            return status, data
+        raise last_error or asyncio.TimeoutError()
+
+    async def _request(self, url: str, params: dict):
+        async with self._semaphore:
+            self.inflight += 1
+            self.requests += 1
+            started = time.perf_counter()
+            status = "error"
+            try:
+                async with self._session.get(url, params=params) as response:
+                    status = response.status
+                    if response.status >= 500 or response.status == 429:
+                        return response.status, None
+                    data = await response.json(loads=json_loads, content_type=None)
+                    return response.status, data
+            except (asyncio.TimeoutError, asyncio.CancelledError):
+                status = "timeout"
+                raise
+            finally:
+                self.inflight -= 1
+                openweather_seconds.observe(time.perf_counter() - started, url.rsplit("/", 1)[-1], str(status))
+
+    def stats(self) -> dict:
+        return {
+            "inflight": self.inflight,
+            "requests": self.requests,
+            "retries": self.retries,
+            "timeouts": self.timeouts,
+            "failures": self.failures,
+            "breaker": self.breaker.stats(),
+        }
+
+
+# Спільний клієнт; життєвим циклом керує main.py (on_startup/on_shutdown)
+weather_client = WeatherClient()
+# Довідник міст: назви геокодуються один раз, далі погода запитується за координатами
+city_resolver = CityResolver(OpenWeatherGeocoder(weather_client))
+
+
+class TTLCache:
+    """LRU-кеш із TTL, який об'єднує однакові одночасні запити в один.
+
+    Поки значення для ключа завантажується, інші виклики з тим самим ключем
+    чекають на той самий запит до OpenWeather замість власного. Для «гарячих»
+    ключів (не менше hot_hits звернень) кеш оновлюється наперед: після
+    refresh_ahead частки TTL запускається фонове оновлення, а протягом
+    stale_ttl після закінчення TTL віддається старе значення, поки
+    завантажується нове (stale-while-revalidate). Якщо завантаження не вдалося,
+    протягом stale_if_error після закінчення TTL віддаються старі дані.
+    """
+
+    def __init__(self, ttl: float, maxsize: int, stale_ttl: float = 0.0,
+                 refresh_ahead: float = 0.8, hot_hits: int = 3, stale_if_error: float = 0.0):
+        self.ttl = ttl
+        self.stale_if_error = stale_if_error
+        self.maxsize = maxsize
+        self.stale_ttl = stale_ttl
+        self.refresh_ahead = refresh_ahead
+        self.hot_hits = hot_hits
+        self._data = OrderedDict()  # key -> [stored_at, value, hits]
+        self._inflight = {}  # key -> asyncio.Task
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.stale_hits = 0
+        self.stale_on_error = 0
+        self.refreshes = 0
+        self.load_errors = 0
+        self.background_errors = 0
+
+    def get(self, key):
+        """Повертає свіже значення з кешу або None."""
+        entry = self._data.get(key)
+        if entry is None or time.monotonic() - entry[0] >= self.ttl:
+            return None
+        self._data.move_to_end(key)
+        return entry[1]
+
+    def ttl_left(self, key) -> float:
+        """Скільки секунд значення ще буде свіжим (0, якщо його немає або воно застаріло)."""
+        entry = self._data.get(key)
+        if entry is None:
+            return 0.0
+        return max(0.0, self.ttl - (time.monotonic() - entry[0]))
+
+    def set(self, key, value):
+        previous = self._data.get(key)
+        # Частину лічильника звернень зберігаємо, щоб гарячий ключ не «вистигав» після оновлення
+        hits = previous[2] // 2 if previous is not None else 0
+        self._data[key] = [time.monotonic(), value, hits]
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    async def get_or_fetch(self, key, fetch, cacheable=lambda value: True):
+        """Повертає значення з кешу або завантажує його через fetch() (один раз на ключ)."""
+        entry = self._data.get(key)
+        if entry is not None:
+            age = time.monotonic() - entry[0]
+            entry[2] += 1
+            hot = entry[2] >= self.hot_hits
+            if age < self.ttl:
+                self.hits += 1
+                self._data.move_to_end(key)
+                if hot and age >= self.ttl * self.refresh_ahead:
+                    self._refresh_in_background(key, fetch, cacheable)
+                return entry[1]
+            if hot and age < self.ttl + self.stale_ttl:
+                self.stale_hits += 1
+                self._data.move_to_end(key)
+                self._refresh_in_background(key, fetch, cacheable)
+                return entry[1]
+        if key in self._inflight:
+            self.coalesced += 1
+        else:
+            self.misses += 1
+        try:
+            return await self.refresh(key, fetch, cacheable)
+        except Exception:
+            entry = self._data.get(key)
+            if entry is not None and time.monotonic() - entry[0] < self.ttl + self.stale_if_error:
+                self.stale_on_error += 1
+                return entry[1]
+            raise
+
+    async def refresh(self, key, fetch, cacheable=lambda value: True):
+        """Завантажує значення незалежно від свіжості кешу (з об'єднанням одночасних запитів)."""
+        task = self._start_load(key, fetch, cacheable)
+        # shield: скасування одного з очікувачів не скасовує спільний запит
+        return await asyncio.shield(task)
+
+    def _start_load(self, key, fetch, cacheable):
+        task = self._inflight.get(key)
+        if task is None:
+            self.refreshes += 1
+            task = asyncio.ensure_future(self._load(key, fetch, cacheable))
+            task.add_done_callback(self._load_done)
+            self._inflight[key] = task
+        return task
+
+    def _load_done(self, task):
+        if not task.cancelled() and task.exception() is not None:
+            self.load_errors += 1
+
+    def _refresh_in_background(self, key, fetch, cacheable):
+        """Оновлення без очікувача (refresh-ahead, stale-while-revalidate): помилку ніхто не побачить, тож логуємо її."""
+        if key in self._inflight:
+            return
+        task = self._start_load(key, fetch, cacheable)
+        task.add_done_callback(lambda t: self._background_done(key, t))
+
+    def _background_done(self, key, task):
+        if task.cancelled() or task.exception() is None:
+            return
+        self.background_errors += 1
+        logger.warning(f"Фонове оновлення кешу для {key} не вдалося: {task.exception()!r}")
+
+    async def _load(self, key, fetch, cacheable):
+        try:
+            value = await fetch()
+            if cacheable(value):
+                self.set(key, value)
+            return value
+        finally:
+            self._inflight.pop(key, None)
+
+    def stats(self) -> dict:
+        return {
+            "size": len(self._data),
+            "inflight": len(self._inflight),
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "stale_hits": self.stale_hits,
+            "stale_on_error": self.stale_on_error,
+            "upstream_loads": self.refreshes,
+            "load_errors": self.load_errors,
+            "background_errors": self.background_errors,
+        }
+
+
+# Версія даних: нова для кожної відповіді OpenWeather, ключ кешу готових текстів
+_data_versions = itertools.count(1)
+
+current_cache = TTLCache(
+    CURRENT_WEATHER_CACHE_TTL, WEATHER_CACHE_MAX_SIZE, stale_ttl=WEATHER_CACHE_STALE_TTL,
+    refresh_ahead=WEATHER_CACHE_REFRESH_AHEAD, hot_hits=WEATHER_CACHE_HOT_HITS,
+    stale_if_error=WEATHER_CACHE_STALE_IF_ERROR,
+)
+forecast_cache = TTLCache(
+    FORECAST_CACHE_TTL, WEATHER_CACHE_MAX_SIZE, stale_ttl=WEATHER_CACHE_STALE_TTL,
+    refresh_ahead=WEATHER_CACHE_REFRESH_AHEAD, hot_hits=WEATHER_CACHE_HOT_HITS,
+    stale_if_error=WEATHER_CACHE_STALE_IF_ERROR,
+)
+
+# Збої OpenWeather, після яких користувач отримує повідомлення про помилку
+WEATHER_ERRORS = (aiohttp.ClientError, asyncio.TimeoutError, UpstreamError, ValueError)
+
+
+def get_upstream_stats() -> dict:
+    """Стан клієнта OpenWeather: запити, повтори, таймаути, запобіжник."""
+    return weather_client.stats()
+
+
+def get_cache_stats() -> dict:
+    """Лічильники кешу (hits/misses/coalesced) для поточної погоди та прогнозу."""
+    return {"current": current_cache.stats(), "forecast": forecast_cache.stats(), "render": render_cache.stats()}
+
+
+async def _cache_request(path: str, city: str, lang: str, parse=None, city_key: str = None):
+    """Повертає (ключ кешу, функцію завантаження) для запиту до OpenWeather.
+
+    city_key — ключ міста зі збережених підписок; за ним координати беруться з довідника
+    міст. Без ключа місто шукається в індексі за назвою.
+    parse перетворює успішну відповідь на компактну форму, яка й зберігається в кеші.
+    """
     params = {
-        "q": city,
         "appid": OPENWEATHER_API_KEY,
         "units": "metric",
         "lang": lang
     }
+    if city_key is not None:
+        resolved = await city_resolver.locate(city_key)
+    else:
+        resolved = city_resolver.lookup(city)
+    if resolved is not None:
+        params["lat"] = resolved.lat
+        params["lon"] = resolved.lon
+        key = (resolved.key, lang)
+    else:
+        # Місто ще не геокодоване (старі записи) — пошук за назвою
+        params["q"] = city
+        key = (normalize_city(city), lang)
+
+    async def load():
+        status, data = await weather_client.get_json(path, params)
+        if status == 200 and parse is not None:
+            data = parse(data)
+        return status, data, next(_data_versions)
+
+    return key, load
+
+def _is_cacheable(value) -> bool:
+    return value[0] == 200
+
+async def fetch_weather_data(cache: TTLCache, path: str, city: str, lang: str, parse=None, city_key: str = None):
+    """Повертає (status, data, version) для міста через кеш; помилкові відповіді не кешуються."""
+    key, load = await _cache_request(path, city, lang, parse, city_key)
+    return await cache.get_or_fetch(key, load, cacheable=_is_cacheable)
+
+async def prefetch_current_weather(city: str, lang: str = "uk", fresh_for: float = 0.0, city_key: str = None) -> bool:
+    """Прогріває кеш поточної погоди, якщо дані не залишатимуться свіжими ще fresh_for секунд."""
+    key, load = await _cache_request("weather", city, lang, city_key=city_key)
+    if current_cache.ttl_left(key) > fresh_for:
+        return False
+    await current_cache.refresh(key, load, cacheable=_is_cacheable)
+    return True
+
+async def get_current_weather(city: str, lang: str = "uk", city_key: str = None) -> str:
+    """Запитує поточну погоду в місті (за ключем city_key, якщо він відомий)."""
     try:
-        async with aiohttp.ClientSession() as session:
-            async with session.get(url, params=params, timeout=10) as response:
-                data = await response.json()
-                if response.status != 200:
-                    return f"⚠️ Помилка: {data.get('message', 'Не вдалося отримати погоду. Перевірте ключ API або назву міста.')}"
-                weather_desc = data["weather"][0]["description"].capitalize()
-                temp = data["main"]["temp"]
-                feels_like = data["main"]["feels_like"]
-                humidity = data["main"]["humidity"]
-                wind_speed = data["wind"]["speed"]
-
-                # Додаємо емодзі залежно від погоди
-                weather_emoji = "☀️" if "чисте небо" in weather_desc.lower() else "☁️" if "хмари" in weather_desc.lower() else "🌦️" if "дощ" in weather_desc.lower() else "⛅"
-                temp_emoji = "🔥" if temp > 28 else "🌞" if temp > 24 else "😎"
-                feels_emoji = "🥵" if feels_like > 28 else "😓" if feels_like > 24 else "😊"
-                humidity_emoji = "🌧️" if humidity > 60 else "💦"
-                wind_emoji = "🌬️" if wind_speed > 5 else "🍃"
-
-                # Формуємо текст із емодзі
-                weather_text = (
-                    f"🌤 **Погода в місті *{city.title()}* 🌆**:\n\n"
-                    f"{weather_emoji} • **{weather_desc}**\n"
-                    f"🌡️ • **Температура**: {temp}°C {temp_emoji}\n"
-                    f"{feels_emoji} • **Відчувається як**: {feels_like}°C\n"
-                    f"💧 • **Вологість**: {humidity}% {humidity_emoji}\n"
-                    f"💨 • **Вітер**: {wind_speed} м/с {wind_emoji}\n"
-                )
-
-                # Додаємо цікавий висновок
-                if temp > 28:
-                    conclusion = f"**Висновок**: Спекотний день у {city.title()}! 🔥 Час для прохолодних напоїв 🥤 і легкого одягу 👕. Не забудь сонцезахисний крем! 🧴"
-                elif temp > 24:
-                    conclusion = f"**Висновок**: Тепло і приємно у {city.title()}! 🌞 Ідеально для прогулянки парком 🌳 чи пікніка 🍉."
-                else:
-                    conclusion = f"**Висновок**: Комфортна погода у {city.title()}! 😎 Чудовий день для активного відпочинку 🚴‍♀️ чи затишного чаювання ☕."
-
-                if humidity > 60:
-                    conclusion += " Але вологість висока, тож бери парасольку на всяк випадок! ☂️"
-
-                return weather_text + "\n" + conclusion
-    except aiohttp.ClientError as e:
-        return f"⚠️ Помилка підключення до сервісу погоди: {str(e)}"
-
-async def get_forecast_5days(city: str, lang: str = "uk") -> str:
+        status, data, version = await fetch_weather_data(current_cache, "weather", city, lang, city_key=city_key)
+        if status != 200:
+            return f"⚠️ Помилка: {data.get('message', 'Не вдалося отримати погоду. Перевірте ключ API або назву міста.')}"
+        return render_cache.get_or_render(
+            ("weather", city.title(), version, lang),
+            lambda: render_current(city, parse_current(data)),
+        )
+    except CircuitOpenError:
+        return "⚠️ Сервіс погоди тимчасово недоступний. Спробуйте за хвилину."
+    except WEATHER_ERRORS as e:
+        return f"⚠️ Помилка підключення до сервісу погоди: {str(e) or type(e).__name__}"
+
+async def get_forecast_5days(city: str, lang: str = "uk", city_key: str = None) -> str:
     """Запитує 5-денний прогноз погоди і групує дані за днями."""
-    url = f"{OPENWEATHER_BASE_URL}/forecast"
-    params = {
-        "q": city,
-        "appid": OPENWEATHER_API_KEY,
-        "units": "metric",
-        "lang": lang
-    }
     try:
-        async with aiohttp.ClientSession() as session:
-            async with session.get(url, params=params, timeout=10) as response:
-                data = await response.json()
-                if response.status != 200:
-                    return f"⚠️ Помилка: {data.get('message', 'Не вдалося отримати прогноз. Перевірте ключ API або назву міста.')}"
-                forecast_list = data.get("list", [])
-                if not forecast_list:
-                    return "⚠️ Немає даних прогнозу."
-
-                grouped = defaultdict(list)
-                for entry in forecast_list:
-                    date = entry["dt_txt"].split(" ")[0]
-                    grouped[date].append(entry)
-
-                days = sorted(grouped.keys())
-                lines = [f"📅 **Прогноз погоди на 5 днів у *{city.title()}* 🌟**:\n"]
-                avg_temps = []
-                rainy_days = 0
-                for day in days[:5]:
-                    entries = grouped[day]
-                    chosen = next((entry for entry in entries if "12:00:00" in entry["dt_txt"]), entries[0])
-                    dt_obj = datetime.strptime(day, "%Y-%m-%d")
-                    formatted_date = dt_obj.strftime("%d.%m.%Y")
-                    desc = chosen["weather"][0]["description"].capitalize()
-                    temp = chosen["main"]["temp"]
-                    temp_min = chosen["main"]["temp_min"]
-                    temp_max = chosen["main"]["temp_max"]
-                    wind_speed = chosen["wind"]["speed"]
-                    humidity = chosen["main"]["humidity"]
-
-                    # Додаємо емодзі для прогнозу
-                    weather_emoji = "☀️" if "чисте небо" in desc.lower() else "☁️" if "хмари" in desc.lower() else "🌦️" if "дощ" in desc.lower() else "⛅"
-                    temp_emoji = "🔥" if temp > 28 else "🌞" if temp > 24 else "😎"
-                    humidity_emoji = "🌧️" if humidity > 60 else "💦"
-                    wind_emoji = "🌬️" if wind_speed > 5 else "🍃"
-
-                    lines.append(
-                        f"📍 **{formatted_date}** 🗓️\n"
-                        f"{weather_emoji} • **{desc}**\n"
-                        f"🌡️ • **Температура**: {temp}°C (мін: {temp_min}°C, макс: {temp_max}°C) {temp_emoji}\n"
-                        f"💧 • **Вологість**: {humidity}% {humidity_emoji}\n"
-                        f"💨 • **Вітер**: {wind_speed} м/с {wind_emoji}\n"
-                    )
-                    avg_temps.append(temp)
-                    if "дощ" in desc.lower():
-                        rainy_days += 1
-
-                # Додаємо цікавий висновок для прогнозу
-                avg_temp = sum(avg_temps) / len(avg_temps)
-                if avg_temp > 28:
-                    conclusion = f"**Висновок для {city.title()}**: Спекотний тиждень попереду! 🔥 Чудовий час для пікніків 🍉 і відпочинку на природі 🌳."
-                elif avg_temp > 24:
-                    conclusion = f"**Висновок для {city.title()}**: Теплий і приємний тиждень! 🌞 Ідеально для прогулянок 🚶‍♀️ і активного відпочинку 🚴‍♀️."
-                else:
-                    conclusion = f"**Висновок для {city.title()}**: Комфортна погода на весь тиждень! 😎 Час для затишних вечорів ☕ і легких прогулянок 🌄."
-
-                if rainy_days > 0:
-                    conclusion += f" Але чекай на {rainy_days} дощових днів 🌧️, тож тримай парасольку напоготові! ☂️"
-                else:
-                    conclusion += " Сонячна погода гарантована, бери сонцезахисний крем! 🧴"
-
-                return "\n".join(lines) + "\n" + conclusion
-    except aiohttp.ClientError as e:
-        return f"⚠️ Помилка підключення до сервісу прогнозу погоди: {str(e)}"
\ No newline at end of file
+        status, forecast, version = await fetch_weather_data(
+            forecast_cache, "forecast", city, lang, parse=Forecast.from_response, city_key=city_key
+        )
+        if status != 200:
+            return f"⚠️ Помилка: {forecast.get('message', 'Не вдалося отримати прогноз. Перевірте ключ API або назву міста.')}"
+        if not len(forecast):
+            return "⚠️ Немає даних прогнозу."
+        return render_cache.get_or_render(
+            ("forecast", city.title(), version, lang),
+            lambda: render_forecast(city, forecast.daily()),
+        )
+    except CircuitOpenError:
+        return "⚠️ Сервіс прогнозу погоди тимчасово недоступний. Спробуйте за хвилину."
+    except WEATHER_ERRORS as e:
+        return f"⚠️ Помилка підключення до сервісу прогнозу погоди: {str(e) or type(e).__name__}"